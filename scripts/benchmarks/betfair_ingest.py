@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Time reading generated Betfair price files and the memory held per row, run from scripts/."""
+
+import random
+import sys
+import tracemalloc
+
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from models.betfair import BSPMap
+from utils.betfair import parse_file
+
+
+HEADER = (
+    'event_id,menu_hint,event_name,event_dt,selection_id,selection_name,win_lose,bsp,ppwap,'
+    'morningwap,ppmax,ppmin,ipmax,ipmin,morningtradedvol,pptradedvol,iptradedvol'
+)
+
+
+def price_file(day: date, races: int, rng: random.Random) -> bytes:
+    lines = [HEADER]
+
+    for race in range(races):
+        event_dt = f'{day:%d-%m-%Y} {12 + race // 6:02d}:{race % 6 * 10:02d}'
+
+        for runner in range(rng.randint(6, 16)):
+            bsp = rng.uniform(1.5, 200)
+            lines.append(
+                f'{race},GB / Course,1m Hcap,{event_dt},{runner},Horse {race} {runner},0,'
+                f'{bsp:.6f},{bsp * 0.95:.6f},{bsp * 1.1:.6f},{bsp * 1.3:.2f},{bsp * 0.8:.2f},'
+                f'{bsp * 2:.2f},{bsp * 0.5:.2f},{rng.uniform(0, 500):.2f},'
+                f'{rng.uniform(0, 50000):.2f},{rng.uniform(0, 20000):.2f}'
+            )
+
+    return '\n'.join(lines).encode()
+
+
+def main():
+    parser = ArgumentParser()
+    _ = parser.add_argument('--days', type=int, default=30, help='Price files to read.')
+    _ = parser.add_argument('--races', type=int, default=30, help='Races in each file.')
+    _ = parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start_day = date(2024, 1, 1)
+    files = [price_file(start_day + timedelta(days=i), args.races, rng) for i in range(args.days)]
+    rows = sum(content.count(b'\n') for content in files)
+
+    tracemalloc.start()
+    start = perf_counter()
+
+    data: BSPMap = {}
+    for content in files:
+        parse_file(content, 'UK', data)
+
+    elapsed = perf_counter() - start
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{len(files)} files, {rows} rows, {len(data)} races')
+    print(f'parse:  {rows / elapsed:,.0f} rows/s')
+    print(f'memory: {held / rows:.0f} bytes per row')
+
+
+if __name__ == '__main__':
+    main()
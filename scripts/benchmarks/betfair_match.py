@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Compare first match against match_runners on a generated busy day, run from scripts/."""
+
+import random
+import sys
+
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from jarowinkler import jarowinkler_similarity
+
+from models.betfair import clean_name
+from utils.betfair_match import SIMILARITY, exact_key, match_runners
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ran', 'tor', 'bel', 'sun', 'star', 'dan', 'ce', 'vi', 'nor', 'the']
+
+
+def horse_name(rng: random.Random) -> str:
+    words = [
+        ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+        for _ in range(rng.randint(1, 3))
+    ]
+    if rng.random() < 0.2:
+        words[0] += "'s"
+    return ' '.join(words)
+
+
+def betfair_name(name: str, rng: random.Random) -> str:
+    # Betfair drops punctuation and now and then spells a name differently
+    if rng.random() < 0.1:
+        name = name.replace(' ', '', 1)
+    return clean_name(name, 'GB')
+
+
+def first_match(horses: list[str], names: list[str], _: list[str]) -> list[int | None]:
+    matches: list[int | None] = []
+
+    for horse in horses:
+        horse = horse.split('(')[0].strip().lower()
+        scores = (jarowinkler_similarity(horse, name) for name in names)
+        matches.append(next((j for j, score in enumerate(scores) if score >= SIMILARITY), None))
+
+    return matches
+
+
+def generate(offs: int, courses: int, runners: int, seed: int):
+    rng = random.Random(seed)
+    day: list[tuple[list[str], list[str], list[str], list[str]]] = []
+
+    for _ in range(offs):
+        rows: list[str] = []
+        races: list[list[str]] = []
+
+        for _ in range(courses):
+            names = [horse_name(rng) for _ in range(rng.randint(runners // 2, runners))]
+            races.append(names)
+            rows.extend(betfair_name(name, rng) for name in names)
+
+        rng.shuffle(rows)
+        keys = [exact_key(row) for row in rows]
+
+        for names in races:
+            horses = [f'{name} ({rng.choice(["IRE", "FR", "GB"])})' for name in names]
+            expected = [clean_name(name, 'GB').replace(' ', '') for name in names]
+            day.append((horses, rows, keys, expected))
+
+    return day
+
+
+def run(matcher, day) -> tuple[float, int]:
+    correct = 0
+    start = perf_counter()
+
+    for horses, rows, keys, _ in day:
+        _ = matcher(horses, rows, keys)
+
+    elapsed = perf_counter() - start
+
+    for horses, rows, keys, expected in day:
+        for j, name in zip(matcher(horses, rows, keys), expected):
+            if j is not None and rows[j].replace(' ', '') == name:
+                correct += 1
+
+    return elapsed, correct
+
+
+def main():
+    parser = ArgumentParser()
+    _ = parser.add_argument('--offs', type=int, default=30, help='Off times in the day.')
+    _ = parser.add_argument('--courses', type=int, default=5, help='Races at each off time.')
+    _ = parser.add_argument('--runners', type=int, default=16, help='Most runners in a race.')
+    _ = parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    day = generate(args.offs, args.courses, args.runners, args.seed)
+    runners = sum(len(horses) for horses, _, _, _ in day)
+
+    print(f'{len(day)} races, {runners} runners, {len(day[0][1])} rows per key')
+
+    for name, matcher in (('first match', first_match), ('match_runners', match_runners)):
+        elapsed, correct = run(matcher, day)
+        print(f'{name:<14} {elapsed * 1000:8.1f} ms  {correct}/{runners} matched correctly')
+
+
+if __name__ == '__main__':
+    main()
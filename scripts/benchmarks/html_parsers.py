@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Time the html_parser backends, each query on the page type it runs on, run from scripts/."""
+
+import sys
+
+from argparse import ArgumentParser
+from collections.abc import Callable
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pages import load_date_pages, saved_pages
+from utils.html_parser import (
+    BODY_SCRIPTS,
+    COURSE_LINKS,
+    NEXT_DATA,
+    HtmlParser,
+    LexborHTMLParser,
+    LexborParser,
+    LxmlParser,
+)
+
+
+type Run = Callable[[HtmlParser, bytes], object]
+
+
+def run(html_parser: HtmlParser, query: Run, pages: list[bytes], repeat: int) -> float:
+    start = perf_counter()
+
+    for _ in range(repeat):
+        for content in pages:
+            _ = query(html_parser, content)
+
+    return (perf_counter() - start) / (len(pages) * repeat)
+
+
+def main():
+    parser = ArgumentParser()
+    _ = parser.add_argument('--dates', type=Path, help='Directory of saved results pages for dates.')
+    _ = parser.add_argument('--profiles', type=Path, help='Directory of saved profile pages.')
+    _ = parser.add_argument('--racecards', type=Path, help='Directory of saved racecard pages.')
+    _ = parser.add_argument('--limit', type=int, default=200, help='Maximum pages of each kind.')
+    _ = parser.add_argument('--repeat', type=int, default=3, help='Passes over the pages.')
+    args = parser.parse_args()
+
+    queries: list[tuple[str, Run, list[bytes]]] = [
+        (
+            'course links',
+            lambda p, content: p.attributes(content, COURSE_LINKS, 'href'),
+            load_date_pages(args.dates, args.limit),
+        ),
+        (
+            'body scripts',
+            lambda p, content: p.first_text(content, BODY_SCRIPTS),
+            saved_pages(args.profiles, args.limit) if args.profiles else [],
+        ),
+        (
+            'next data',
+            lambda p, content: p.first_text(content, NEXT_DATA),
+            saved_pages(args.racecards, args.limit) if args.racecards else [],
+        ),
+    ]
+
+    backends: list[HtmlParser] = [LxmlParser()]
+
+    if LexborHTMLParser is not None:
+        backends.append(LexborParser())
+    else:
+        print('selectolax is not installed, only timing lxml.')
+
+    timed = 0
+
+    for label, query, pages in queries:
+        if not pages:
+            print(f'{label}: no pages found, skipped')
+            continue
+
+        timed += 1
+        print(f'{label}: {len(pages)} pages')
+
+        for backend in backends:
+            per_page = run(backend, query, pages, args.repeat)
+            print(f'  {backend.name:<8} {per_page * 1000:.3f} ms per page')
+
+    if not timed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from utils.page_cache import PageCache
+from utils.paths import CACHE_ROOT
+from utils.race_index import RaceIndex
+
+
+# saved pages carry no url, Race only reads the course, date and id from it
+PAGE_URL = 'https://www.racingpost.com/results/32/aintree/2020-04-04/{}'
+
+# results pages for a whole date, the pages course links are read from
+DATE_URL = 'https://www.racingpost.com/results/{}'
+
+
+def saved_pages(pages_dir: Path, limit: int) -> list[bytes]:
+    return [f.read_bytes() for f in sorted(pages_dir.glob('*.html'))[:limit]]
+
+
+def load_pages(pages_dir: Path | None, limit: int) -> list[tuple[str, bytes]]:
+    if pages_dir is not None:
+        saved = saved_pages(pages_dir, limit)
+        return [(PAGE_URL.format(i), content) for i, content in enumerate(saved)]
+
+    cache = PageCache(CACHE_ROOT / 'pages')
+    index = RaceIndex(CACHE_ROOT / 'races.db')
+
+    pages: list[tuple[str, bytes]] = []
+
+    for url in index.recent_urls(limit * 4):
+        content = cache.get(url)
+        if content is not None:
+            pages.append((url, content))
+        if len(pages) == limit:
+            break
+
+    index.close()
+    return pages
+
+
+def load_date_pages(pages_dir: Path | None, limit: int) -> list[bytes]:
+    if pages_dir is not None:
+        return saved_pages(pages_dir, limit)
+
+    cache = PageCache(CACHE_ROOT / 'pages')
+    index = RaceIndex(CACHE_ROOT / 'races.db')
+
+    pages: list[bytes] = []
+
+    for race_date in index.recent_dates(limit * 4):
+        content = cache.get(DATE_URL.format(race_date))
+        if content is not None:
+            pages.append(content)
+        if len(pages) == limit:
+            break
+
+    index.close()
+    return pages
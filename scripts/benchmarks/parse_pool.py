@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Compare parsing race pages in a thread pool and a process pool, run from scripts/."""
+
+import sys
+
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pages import load_pages
+from utils.parsing import free_threaded, parse_pages
+from utils.settings import Settings
+
+
+def run(pages: list[tuple[str, bytes]], workers: int, threads: bool, fields: list[str]) -> float:
+    start = perf_counter()
+
+    for _ in parse_pages(pages, workers, fields, None, lambda url, content: None, threads):
+        pass
+
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser()
+    _ = parser.add_argument('--pages', type=Path, help='Directory of saved .html result pages.')
+    _ = parser.add_argument('--limit', type=int, default=200, help='Maximum number of pages.')
+    _ = parser.add_argument('--repeat', type=int, default=3, help='Passes over the pages.')
+    _ = parser.add_argument('--workers', type=int, default=4, help='Threads or processes.')
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.limit) * args.repeat
+
+    if not pages:
+        print('No pages found.')
+        sys.exit(1)
+
+    fields = Settings().fields
+
+    print(f'{len(pages)} races, {args.workers} workers, free-threaded: {free_threaded()}')
+
+    for name, threads in (('threads', True), ('processes', False)):
+        elapsed = run(pages, args.workers, threads, fields)
+        print(f'{name:<10} {len(pages) / elapsed:8.1f} races/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Time building and extracting result pages, optionally against a baseline ref, run from scripts/."""
+
+import subprocess
+import sys
+
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+
+SCRIPTS = Path(__file__).resolve().parents[1]
+
+# as in pages.py, which imports the current tree and so is not used for a baseline run
+PAGE_URL = 'https://www.racingpost.com/results/32/aintree/2020-04-04/{}'
+
+
+def time_races(pages: list[tuple[str, bytes]], fields: list[str], repeat: int) -> None:
+    # imported here so a baseline run picks up the modules of its own tree
+    from utils.race import Race, VoidRaceError
+
+    try:
+        from utils.page_slice import parse_race_page
+    except ImportError:
+        from lxml.html import fromstring as parse_race_page
+
+    try:
+        from utils.race import IncompleteRaceError
+        skipped = (VoidRaceError, IncompleteRaceError)
+    except ImportError:
+        skipped = (VoidRaceError,)
+
+    build = 0.0
+    extract = 0.0
+    races = 0
+
+    for _ in range(repeat):
+        for url, content in pages:
+            start = perf_counter()
+            doc = parse_race_page(content)
+            built = perf_counter()
+
+            try:
+                _ = Race(None, url, doc, fields)
+            except skipped:
+                pass
+
+            extract += perf_counter() - built
+            build += built - start
+            races += 1
+
+    print(f'{len(pages)} pages, {races} races parsed')
+    print(f'document: {build / races * 1000:.3f} ms per race')
+    print(f'extract:  {extract / races * 1000:.3f} ms per race')
+    print(f'total:    {(build + extract) / races * 1000:.3f} ms per race')
+
+
+def time_baseline(ref: str, pages: list[tuple[str, bytes]], fields: list[str], repeat: int) -> None:
+    with TemporaryDirectory() as tmp:
+        tree = Path(tmp) / 'tree'
+        saved = Path(tmp) / 'pages'
+        tree.mkdir()
+        saved.mkdir()
+
+        archive = subprocess.run(['git', 'archive', ref], cwd=SCRIPTS.parent, capture_output=True, check=True)
+        _ = subprocess.run(['tar', '-x', '-C', str(tree)], input=archive.stdout, check=True)
+
+        for i, (_, content) in enumerate(pages):
+            _ = (saved / f'{i:05d}.html').write_bytes(content)
+
+        # run from the baseline scripts directory, which it reads relative paths from
+        _ = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                '--tree', str(tree / 'scripts'),
+                '--pages', str(saved),
+                '--limit', str(len(pages)),
+                '--repeat', str(repeat),
+                '--fields', ','.join(fields),
+            ],
+            cwd=tree / 'scripts',
+            check=True,
+        )
+
+
+def main():
+    parser = ArgumentParser()
+    _ = parser.add_argument('--pages', type=Path, help='Directory of saved .html result pages.')
+    _ = parser.add_argument('--limit', type=int, default=200, help='Maximum number of pages.')
+    _ = parser.add_argument('--repeat', type=int, default=3, help='Passes over the pages.')
+    _ = parser.add_argument('--fields', help='Comma separated fields instead of the settings.')
+    _ = parser.add_argument('--baseline', help='Git ref to time the same pages against.')
+    _ = parser.add_argument('--tree', type=Path, help='Scripts directory to time, used by --baseline.')
+    args = parser.parse_args()
+
+    if args.tree is not None:
+        # a baseline tree has no page cache loader, only saved pages
+        sys.path.insert(0, str(args.tree))
+        files = sorted(args.pages.glob('*.html'))[: args.limit]
+        pages = [(PAGE_URL.format(i), f.read_bytes()) for i, f in enumerate(files)]
+        time_races(pages, args.fields.split(','), args.repeat)
+        return
+
+    sys.path.insert(0, str(SCRIPTS))
+
+    from pages import load_pages
+    from utils.settings import Settings
+
+    pages = load_pages(args.pages, args.limit)
+
+    if not pages:
+        print('No pages found.')
+        sys.exit(1)
+
+    fields = args.fields.split(',') if args.fields else Settings().fields
+
+    if args.baseline:
+        print(f'baseline ({args.baseline})')
+        sys.stdout.flush()
+        time_baseline(args.baseline, pages, fields, args.repeat)
+        print('\ncurrent')
+
+    time_races(pages, fields, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,17 +9,20 @@ import tomli
 from collections import defaultdict
 from dotenv import load_dotenv
 from functools import partial
-from lxml import html
 from pathlib import Path
 from orjson import dumps, loads
 from tqdm import tqdm
 from typing import Any
 
 from utils.cleaning import clean_string
+from utils.embedded_json import scan_next_data
+from utils.html_parser import NEXT_DATA, HtmlParser, get_parser
 from utils.network import NetworkClient
+from utils.paths import CACHE_ROOT
 from utils.profiles import get_profiles
 from utils.region import valid_region
 from utils.stats import Stats
+from utils.throttle import RateLimits
 from models.racecard import Racecard, Runner
 
 _ = load_dotenv()
@@ -300,6 +303,8 @@ def scrape_racecards(
     date: str,
     config: dict[str, Any],
     client: NetworkClient,
+    html_parser: HtmlParser,
+    workers: int = 1,
 ) -> Racecards:
     racecards: Racecards = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
 
@@ -307,118 +312,135 @@ def scrape_racecards(
     fetch_profiles: bool = data_opts.get('fetch_profiles', False)
     fetch_stats: bool = data_opts.get('fetch_stats', False)
 
-    for meeting in tqdm(
-        meetings,
-        desc=date,
-        bar_format='{desc}: {percentage:3.0f}% |{bar:49}| {n}/{total} ETA {remaining}',
-        ncols=91,
-    ):
-        course_id = meeting['venueUid']
-        course_key = meeting['courseKey']
+    url_base = 'https://www.racingpost.com'
 
+    races: list[tuple[dict[str, Any], dict[str, Any], str, str]] = []
+
+    for meeting in meetings:
         for race in meeting['races']:
+            course_id = meeting['venueUid']
+            course_key = meeting['courseKey']
             race_id = race['raceId']
 
-            url_base = 'https://www.racingpost.com'
             url_racecard = f'{url_base}/racecards/{course_id}/{course_key}/{date}/{race_id}/'
             url_runners = f'{url_base}/profile/horse/data/cardrunners/{race_id}.json'
 
-            status_racecard, resp_racecard = client.get(url_racecard)
-            status_runners, resp_runners = client.get(url_runners)
+            races.append((meeting, race, url_racecard, url_runners))
 
-            if status_racecard != 200 or status_runners != 200:
-                print('Failed to get racecard data.')
-                print(f'status: {status_racecard} url: {url_racecard}')
-                print(f'status: {status_runners} url: {url_runners}')
-                continue
+    # racecard and runners pages are fetched as one ordered stream, two responses per race
+    race_urls = [url for *_, url_racecard, url_runners in races for url in (url_racecard, url_runners)]
+    responses = client.get_many(race_urls, workers)
 
-            try:
-                runners_map = resp_runners.json()['runners']
-                runners_json = list(runners_map.values())
-            except (KeyError, IndexError, ValueError):
-                print('Failed to parse JSON for runners.')
-                print(f'url: {url_runners}')
-                continue
+    for meeting, race, url_racecard, url_runners in tqdm(
+        races,
+        desc=date,
+        bar_format='{desc}: {percentage:3.0f}% |{bar:49}| {n}/{total} ETA {remaining}',
+        ncols=91,
+    ):
+        course_id = meeting['venueUid']
+        race_id = race['raceId']
 
-            doc = html.fromstring(resp_racecard.content)
-            json_string = doc.get_element_by_id('__NEXT_DATA__').text_content()
+        _, status_racecard, resp_racecard = next(responses)
+        _, status_runners, resp_runners = next(responses)
 
-            try:
-                data = loads(json_string)['props']['pageProps']['initialState']
-                meeting_meta = data['meetings']['byDate'][date]['races']['byRaceId'][race_id]
-                race_meta = data['racePage']['data']['race']
-                runners = data['racePage']['data']['runners']
-            except KeyError:
-                print('Failed to get racecard data.')
-                print(f'Invalid JSON at URL: {url_racecard}')
-                continue
+        if status_racecard != 200 or status_runners != 200:
+            print('Failed to get racecard data.')
+            print(f'status: {status_racecard} url: {url_racecard}')
+            print(f'status: {status_runners} url: {url_runners}')
+            continue
 
-            profiles: dict[str, dict[str, Any]] = {}
-            if fetch_profiles:
-                profile_hrefs = [r['horseUrl'] for r in runners]
-                profile_urls = [
-                    f'https://www.racingpost.com{a.split("#")[0]}/form' for a in profile_hrefs
-                ]
-                profiles = get_profiles(client, profile_urls)
+        try:
+            runners_map = resp_runners.json()['runners']
+            runners_json = list(runners_map.values())
+        except (KeyError, IndexError, ValueError):
+            print('Failed to parse JSON for runners.')
+            print(f'url: {url_runners}')
+            continue
+
+        next_data = scan_next_data(resp_racecard.content)
+
+        try:
+            if next_data is None:
+                json_string = html_parser.first_text(resp_racecard.content, NEXT_DATA)
+                if json_string is None:
+                    raise KeyError('__NEXT_DATA__')
+                next_data = loads(json_string)
+
+            data = next_data['props']['pageProps']['initialState']
+            meeting_meta = data['meetings']['byDate'][date]['races']['byRaceId'][race_id]
+            race_meta = data['racePage']['data']['race']
+            runners = data['racePage']['data']['runners']
+        except KeyError:
+            print('Failed to get racecard data.')
+            print(f'Invalid JSON at URL: {url_racecard}')
+            continue
+
+        profiles: dict[str, dict[str, Any]] = {}
+        if fetch_profiles:
+            profile_hrefs = [r['horseUrl'] for r in runners]
+            profile_urls = [
+                f'https://www.racingpost.com{a.split("#")[0]}/form' for a in profile_hrefs
+            ]
+            profiles = get_profiles(client, profile_urls, html_parser, workers)
 
-            stats = None
-            if fetch_stats:
-                status, resp = client.get(
-                    f'https://www.racingpost.com/api/racing/free-stats-tab/?raceId={race_id}&date={date}'
-                )
-                if status == 200:
-                    stats = Stats(resp.json())
+        stats = None
+        if fetch_stats:
+            status, resp = client.get(
+                f'https://www.racingpost.com/api/racing/free-stats-tab/?raceId={race_id}&date={date}'
+            )
+            if status == 200:
+                stats = Stats(resp.json())
 
-            racecard: Racecard = Racecard()
+        racecard: Racecard = Racecard()
 
-            racecard.href = url_racecard
-            racecard.race_id = int(race_id)
-            racecard.date = date
+        racecard.href = url_racecard
+        racecard.race_id = int(race_id)
+        racecard.date = date
 
-            racecard.off_time = race_meta['startTime']
+        racecard.off_time = race_meta['startTime']
 
-            racecard.course_id = course_id
-            racecard.course = race_meta['courseStyleName']
+        racecard.course_id = course_id
+        racecard.course = race_meta['courseStyleName']
 
-            racecard.course_detail = race_meta['straightRoundJubileeCode']
-            racecard.course_info = data['racePage']['data']['courseInfo']
+        racecard.course_detail = race_meta['straightRoundJubileeCode']
+        racecard.course_info = data['racePage']['data']['courseInfo']
 
-            if racecard.course == 'Belmont At The Big A':
-                racecard.course_id = 255
-                racecard.course = 'Aqueduct'
+        if racecard.course == 'Belmont At The Big A':
+            racecard.course_id = 255
+            racecard.course = 'Aqueduct'
 
-            racecard.region = meeting['venueCountryCode']
+        racecard.region = meeting['venueCountryCode']
 
-            racecard.race_name = race['raceTitle']
-            racecard.race_type = race['raceType']
+        racecard.race_name = race['raceTitle']
+        racecard.race_type = race['raceType']
 
-            racecard.distance_f = race_meta['distanceFurlongs']
-            racecard.distance_y = race_meta['distanceYards']
-            racecard.distance = meeting_meta['displayDistance']
+        racecard.distance_f = race_meta['distanceFurlongs']
+        racecard.distance_y = race_meta['distanceYards']
+        racecard.distance = meeting_meta['displayDistance']
 
-            racecard.pattern = race_meta['raceGroupDesc']
-            racecard.race_class = race['raceClass']
-            racecard.age_band = race['ageRestriction']
-            racecard.rating_band = race['ratingBand']
+        racecard.pattern = race_meta['raceGroupDesc']
+        racecard.race_class = race['raceClass']
+        racecard.age_band = race['ageRestriction']
+        racecard.rating_band = race['ratingBand']
 
-            racecard.prizes = [{str(x['position_no']): x['prize_sterling']} for x in race_meta['prizes']]
-            racecard.prize = race_meta['totalPrizeMoney']['total_prize_sterling']
-            racecard.prize_winner = race_meta['formattedTotalPrizeMoney']
+        racecard.prizes = [{str(x['position_no']): x['prize_sterling']} for x in race_meta['prizes']]
+        racecard.prize = race_meta['totalPrizeMoney']['total_prize_sterling']
+        racecard.prize_winner = race_meta['formattedTotalPrizeMoney']
 
-            racecard.field_size = race['numberOfRunners']
+        racecard.field_size = race['numberOfRunners']
 
-            racecard.handicap = race['isHandicap']
-            racecard.going = race['going']
-            racecard.surface = race['surfaceType']
-            racecard.category = race['category']
+        racecard.handicap = race['isHandicap']
+        racecard.going = race['going']
+        racecard.surface = race['surfaceType']
+        racecard.category = race['category']
 
-            racecard.runners = parse_runners(stats, runners_json, profiles, config)
+        racecard.runners = parse_runners(stats, runners_json, profiles, config)
 
-            assert racecard.region is not None
-            assert racecard.course is not None
-            assert racecard.off_time is not None
+        assert racecard.region is not None
+        assert racecard.course is not None
+        assert racecard.off_time is not None
 
-            racecards[racecard.region][racecard.course][racecard.off_time] = racecard.to_dict()
+        racecards[racecard.region][racecard.course][racecard.off_time] = racecard.to_dict()
 
     return racecards
 
@@ -450,6 +472,14 @@ def main() -> None:
         metavar='N',
     )
 
+    _ = parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of requests to keep in flight (default 1).',
+        metavar='N',
+    )
+
     _ = parser.add_argument(
         '--region',
         type=str,
@@ -459,6 +489,9 @@ def main() -> None:
 
     args = parser.parse_args()
 
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
     dates: list[str] = [
         (datetime.date.today() + datetime.timedelta(days=i)).isoformat() for i in range(max_days)
     ]
@@ -484,16 +517,25 @@ def main() -> None:
     client = NetworkClient(
         email=os.getenv('EMAIL'),
         access_token=os.getenv('ACCESS_TOKEN'),
+        limits=RateLimits.from_settings(config),
+        cookie_file=CACHE_ROOT / 'cookies.json',
     )
 
+    html_parser = get_parser(config.get('html_parser', 'auto'))
+
     meetings = get_meetings(client, dates, region)
 
     for date in meetings:
-        racecards = scrape_racecards(meetings[date], date, config, client)
+        racecards = scrape_racecards(
+            meetings[date], date, config, client, html_parser, args.workers
+        )
 
         with open(f'../racecards/{date}.json', 'w', encoding='utf-8') as f:
             _ = f.write(dumps(racecards).decode('utf-8'))
 
+    if args.workers > 1:
+        print(f'Concurrency: {client.controller.summary()}')
+
 
 if __name__ == '__main__':
     main()
@@ -6,18 +6,25 @@ import shutil
 import sys
 
 from collections.abc import Callable
-from datetime import date
+from datetime import date, timedelta
 from dotenv import load_dotenv
-from lxml import html
+from functools import partial
 from orjson import loads
-from pathlib import Path
 from typing import TextIO, TYPE_CHECKING
 
-from utils.argparser import ArgParser
-from utils.betfair import Betfair
+from utils.argparser import ArgParser, ParsedRequest
+from utils.betfair import Betfair, MissingFiles
+from utils.betfair_cache import BetfairCache
+from utils.date import date_windows
+from utils.html_parser import COURSE_LINKS, HtmlParser, get_parser
 from utils.network import NetworkClient
-from utils.paths import Paths, build_paths
+from utils.page_cache import SETTLED_DAYS, PageCache
+from utils.page_slice import parse_race_page
+from utils.paths import CACHE_ROOT, Paths, build_paths
+from utils.planner import CourseYear, plan_discovery
+from utils.race_index import RaceIndex
 from utils.settings import Settings
+from utils.throttle import RateLimits
 from utils.update import Update
 
 _ = load_dotenv()
@@ -25,12 +32,10 @@ _ = load_dotenv()
 settings = Settings()
 
 if TYPE_CHECKING:
+    from models.betfair import BSPMap
     from utils.betfair import Betfair
-
-RACE_TYPES: dict[str, set[str]] = {
-    'flat': {'Flat'},
-    'jumps': {'Chase', 'Hurdle', 'NH Flat'},
-}
+    from utils.parsing import ParsedRace
+    from utils.race_filter import RaceFilter
 
 
 def check_for_update() -> bool:
@@ -46,10 +51,15 @@ def check_for_update() -> bool:
     success = update.pull_latest()
 
     if success:
-        cache_root = Path(__file__).resolve().parents[1] / '.cache'
-
-        if cache_root.exists():
-            shutil.rmtree(cache_root)
+        # raw pages do not depend on the code that parses them, keep them across updates
+        if CACHE_ROOT.exists():
+            for entry in CACHE_ROOT.iterdir():
+                if entry.name in {'pages', 'betfair'}:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry)
+                else:
+                    entry.unlink()
         print('Updated successfully.')
     else:
         print('Failed to update.')
@@ -59,8 +69,6 @@ def check_for_update() -> bool:
 
 def clear_request(paths: Paths) -> None:
     for p in (
-        paths.urls,
-        paths.betfair,
         paths.progress,
         paths.output,
     ):
@@ -76,115 +84,182 @@ def sort_key(url: str) -> tuple[str, str]:
 
 
 def get_race_urls(
-    years: list[str], tracks: list[tuple[str, str]], race_type: str, client: NetworkClient
+    years: list[str],
+    tracks: list[tuple[str, str]],
+    race_type: str,
+    client: NetworkClient,
+    index: RaceIndex,
+    workers: int = 1,
 ) -> list[str]:
+    discover_course_years(years, tracks, race_type, client, index, workers)
+
+    course_ids = [course_id for course_id, _ in tracks]
+    return sorted(index.course_year_urls(course_ids, years, race_type), key=sort_key)
+
+
+def discover_course_years(
+    years: list[str],
+    tracks: list[tuple[str, str]],
+    race_type: str,
+    client: NetworkClient,
+    index: RaceIndex,
+    workers: int = 1,
+) -> None:
+    targets = [
+        (course_id, course, year, race_type)
+        for course_id, course in tracks
+        for year in years
+        if not index.has_course_year(course_id, year, race_type)
+    ]
+
+    fetch_course_years(targets, client, index, workers)
+
+
+def fetch_course_years(
+    targets: list[CourseYear],
+    client: NetworkClient,
+    index: RaceIndex,
+    workers: int = 1,
+) -> None:
     url_course_base = 'https://www.racingpost.com:443/profile/course/filter/results'
     url_result_base = 'https://www.racingpost.com/results'
 
-    urls: set[str] = set()
+    race_list_urls = [
+        f'{url_course_base}/{course_id}/{year}/{race_type}/all-races'
+        for course_id, _, year, race_type in targets
+    ]
 
-    for course_id, course in tracks:
-        for year in years:
-            race_list_url = f'{url_course_base}/{course_id}/{year}/{race_type}/all-races'
+    failed: list[tuple[int, str]] = []
 
-            status, response = client.get(race_list_url)
+    # each course year is saved to the index as it arrives, a rerun only fetches what is missing
+    for (course_id, course, year, race_type), (race_list_url, status, response) in zip(
+        targets, client.get_many(race_list_urls, workers)
+    ):
+        if status != 200:
+            failed.append((status, race_list_url))
+            continue
 
-            if status != 200:
-                print(f'Failed to get race urls.\nStatus: {status}, URL: {race_list_url}')
-                sys.exit(1)
+        data = loads(response.text).get('data', {})
+        races = data.get('principleRaceResults', []) or []
 
-            data = loads(response.text).get('data', {})
-            races = data.get('principleRaceResults', [])
+        slice_urls: list[str] = []
 
-            if not races:
-                continue
+        for race in races:
+            race_date = race['raceDatetime'][:10]
+            race_id = race['raceInstanceUid']
+            race_url = f'{url_result_base}/{course_id}/{course}/{race_date}/{race_id}'
+            slice_urls.append(race_url.replace(' ', '-').replace("'", ''))
+
+        index.add_course_year(
+            course_id, year, race_type, slice_urls, season_complete(year, race_type)
+        )
 
-            for race in races:
-                race_date = race['raceDatetime'][:10]
-                race_id = race['raceInstanceUid']
-                race_url = f'{url_result_base}/{course_id}/{course}/{race_date}/{race_id}'
-                urls.add(race_url.replace(' ', '-').replace("'", ''))
+    exit_on_failures(failed, 'course years')
 
-    return sorted(urls, key=sort_key)
+
+def season_complete(year: str, race_type: str) -> bool:
+    # a jumps season starting in a year runs into the next one
+    last_year = date.today().year - (0 if race_type == 'flat' else 1)
+    return int(year) < last_year
 
 
 def get_race_urls_date(
-    dates: list[date], tracks: list[tuple[str, str]], client: NetworkClient
+    dates: list[date],
+    tracks: list[tuple[str, str]],
+    race_type: str,
+    client: NetworkClient,
+    index: RaceIndex,
+    html_parser: HtmlParser,
+    workers: int = 1,
 ) -> list[str]:
-    urls: set[str] = set()
     course_ids: set[str] = {t[0] for t in tracks}
 
-    for race_date in dates:
-        url = f'https://www.racingpost.com/results/{race_date}'
+    plan = plan_discovery(dates, tracks, race_type, index)
 
-        _, response = client.get(url)
-        doc = html.fromstring(response.content)
+    if plan.cost:
+        print(f'Finding races: {plan.cost} requests by {plan.strategy.replace("_", " ")}')
 
-        races = doc.xpath('//a[@data-test-selector="link-listCourseNameLink"]')
-        for race in races:
-            course_id = race.attrib['href'].split('/')[2]
-            if course_id in course_ids:
-                urls.add(f'https://www.racingpost.com{race.attrib["href"]}')
+    if plan.course_years:
+        fetch_course_years(plan.course_years, client, index, workers)
+    else:
+        fetch_dates(plan.dates, client, index, html_parser, workers)
 
-    return sorted(urls, key=sort_key)
+    # course listings cover whole seasons, the index query keeps only the requested dates
+    return sorted(set(index.date_urls(dates, course_ids, race_type)), key=sort_key)
 
 
-def load_or_save_urls(
-    path: Path,
-    builder: Callable[[], list[str]],
-) -> list[str]:
-    if path.exists():
-        return [line.strip() for line in path.read_text().splitlines() if line.strip()]
+def fetch_dates(
+    dates: list[date],
+    client: NetworkClient,
+    index: RaceIndex,
+    html_parser: HtmlParser,
+    workers: int = 1,
+) -> None:
+    date_urls = [f'https://www.racingpost.com/results/{race_date}' for race_date in dates]
 
-    urls = builder()
-    path.parent.mkdir(parents=True, exist_ok=True)
-    _ = path.write_text('\n'.join(urls))
+    failed: list[tuple[int, str]] = []
 
-    return urls
+    # a results page lists every course, so it serves any later request for that date
+    for race_date, (date_url, status, response) in zip(dates, client.get_many(date_urls, workers)):
+        if status != 200:
+            failed.append((status, date_url))
+            continue
 
+        hrefs = html_parser.attributes(response.content, COURSE_LINKS, 'href')
+        day_urls = [f'https://www.racingpost.com{href}' for href in hrefs]
 
-def prepare_betfair(
-    race_urls: list[str],
-    paths: Paths,
-) -> 'Betfair | None':
-    if not settings.toml or not settings.toml.get('betfair_data', False):
-        return None
+        index.add_date(race_date, day_urls, date_complete(race_date))
 
-    from utils.betfair import Betfair
+    exit_on_failures(failed, 'dates')
 
-    if paths.betfair.exists():
-        print('Using cached Betfair data')
-        return Betfair.from_csv(paths.betfair)
 
-    print('Fetching Betfair data...')
+def exit_on_failures(failed: list[tuple[int, str]], kind: str) -> None:
+    if not failed:
+        return
 
-    betfair = Betfair(race_urls)
+    print(f'Failed to get race urls for {len(failed)} {kind}.')
+    for status, url in failed:
+        print(f'Status: {status}, URL: {url}')
+    print('Run the request again to retry them, the rest have been saved.')
+    sys.exit(1)
 
-    with open(paths.betfair, 'w') as f:
-        fields = settings.toml.get('fields', {}).get('betfair', {})
-        header = ','.join(['date', 'region', 'off', 'horse'] + list(fields.keys()))
-        _ = f.write(header + '\n')
 
-        for row in betfair.rows:
-            values = ['' if v is None else str(v) for v in row.to_dict().values()]
-            _ = f.write(','.join(values) + '\n')
+def date_complete(race_date: date) -> bool:
+    return race_date <= date.today() - timedelta(days=SETTLED_DAYS)
 
-    return betfair
+
+def prepare_betfair(race_urls: list[str]) -> 'Betfair | None':
+    if not settings.toml or not settings.toml.get('betfair_data', False):
+        return None
+
+    from utils.betfair import Betfair, MissingFiles
+
+    print('Loading Betfair data...')
+
+    return Betfair(
+        race_urls,
+        BetfairCache(CACHE_ROOT / 'betfair' / 'files'),
+        workers=settings.toml.get('betfair_workers', 4),
+        limits=RateLimits.from_settings(settings.toml),
+        missing=MissingFiles(CACHE_ROOT / 'betfair' / 'missing.json'),
+    )
 
 
 def scrape_races(
     race_urls: list[str],
     paths: Paths,
-    race_type: str,
+    race_filter: 'RaceFilter',
     client: NetworkClient,
     file_writer: Callable[[str, bool], TextIO],
+    workers: int = 1,
+    parse_workers: int = 0,
+    parse_threads: bool = False,
 ):
-    from utils.race import Race, VoidRaceError
+    from utils.parsing import parse_pages
 
-    betfair = prepare_betfair(
-        race_urls=race_urls,
-        paths=paths,
-    )
+    betfair = prepare_betfair(race_urls)
+
+    bsp_map = betfair.data if betfair else None
 
     last_url = paths.progress.read_text().strip() if paths.progress.exists() else None
 
@@ -199,36 +274,174 @@ def scrape_races(
 
     append = last_url is not None and paths.output.exists()
 
+    pages = ((url, response.content) for url, _, response in client.get_many(race_urls, workers))
+    parse_inline = partial(parse_page, client, bsp_map, race_filter)
+
+    if parse_workers > 0:
+        parsed_races = parse_pages(
+            pages, parse_workers, settings.fields, bsp_map, parse_inline, parse_threads, race_filter
+        )
+    else:
+        parsed_races = ((url, parse_inline(url, content)) for url, content in pages)
+
     with file_writer(str(paths.output), append=append) as f:
         if not append:
             _ = f.write(settings.csv_header + '\n')
 
-        for url in race_urls:
-            _, response = client.get(url)
-            doc = html.fromstring(response.content)
-
-            try:
-                race = (
-                    Race(client, url, doc, settings.fields, betfair.data)
-                    if betfair
-                    else Race(client, url, doc, settings.fields)
-                )
-            except VoidRaceError:
+        # races come back in url order, so the progress file always marks a finished prefix
+        for url, parsed in parsed_races:
+            if parsed is None:
                 continue
 
-            allowed = RACE_TYPES.get(race_type)
-            if allowed is not None and race.race_info.race_type not in allowed:
+            for row in parsed:
+                _ = f.write(row + '\n')
+
+            _ = paths.progress.write_text(url)
+
+
+def scrape_windows(
+    args: ParsedRequest,
+    paths: Paths,
+    client: NetworkClient,
+    index: RaceIndex,
+    file_writer: Callable[[str, bool], TextIO],
+    parse_workers: int = 0,
+    parse_threads: bool = False,
+):
+    """Find, fetch and write the request --window days at a time."""
+    course_ids = [course_id for course_id, _ in args.tracks]
+
+    if args.dates:
+        html_parser = get_parser(settings.toml.get('html_parser', 'auto'))
+        dates = sorted(args.dates)
+    else:
+        discover_course_years(
+            args.years, args.tracks, args.race_type, client, index, args.workers
+        )
+        dates = index.course_year_dates(course_ids, args.years, args.race_type)
+
+    # urls are written in date order, windows ending before the last written race are done
+    last_url = paths.progress.read_text().strip() if paths.progress.exists() else None
+    done = date.fromisoformat(last_url.split('/')[6]) if last_url else None
+
+    for window in date_windows(dates, args.window):
+        if done is not None and window[-1] < done:
+            continue
+
+        if args.dates:
+            race_urls = get_race_urls_date(
+                window, args.tracks, args.race_type, client, index, html_parser, args.workers
+            )
+        else:
+            race_urls = sorted(
+                index.course_year_urls(
+                    course_ids, args.years, args.race_type, (window[0], window[-1])
+                ),
+                key=sort_key,
+            )
+
+        print(f'Window {window[0]} to {window[-1]}: {len(race_urls)} races')
+
+        scrape_races(
+            race_urls,
+            paths,
+            args.race_filter,
+            client,
+            file_writer,
+            args.workers,
+            parse_workers,
+            parse_threads,
+        )
+
+
+def parse_page(
+    client: NetworkClient,
+    bsp_map: 'BSPMap | None',
+    race_filter: 'RaceFilter',
+    url: str,
+    content: bytes,
+) -> 'ParsedRace | None':
+    from utils.race import FilteredRaceError, Race, VoidRaceError
+
+    doc = parse_race_page(content)
+
+    try:
+        race = Race(client, url, doc, settings.fields, bsp_map, race_filter)
+    except (VoidRaceError, FilteredRaceError):
+        return None
+
+    return race.csv_data
+
+
+def rebuild_races(
+    race_urls: list[str],
+    paths: Paths,
+    race_filter: 'RaceFilter',
+    file_writer: Callable[[str, bool], TextIO],
+    parse_workers: int = 0,
+    parse_threads: bool = False,
+):
+    from utils.parsing import parse_cached_race, parse_executor
+
+    betfair = None
+    if settings.toml and settings.toml.get('betfair_data', False):
+        betfair = Betfair(
+            race_urls,
+            BetfairCache(CACHE_ROOT / 'betfair' / 'files'),
+            missing=MissingFiles(CACHE_ROOT / 'betfair' / 'missing.json'),
+            fetch=False,
+        )
+        if betfair.uncached:
+            print(f'{len(betfair.uncached)} Betfair files are not cached, rebuilding without them')
+
+    print(f'Rebuilding {len(race_urls)} races from cached pages')
+
+    skipped = 0
+
+    with (
+        parse_executor(
+            parse_workers,
+            parse_threads,
+            settings.fields,
+            betfair.data if betfair else None,
+            race_filter,
+            CACHE_ROOT / 'pages',
+        ) as executor,
+        file_writer(str(paths.output), append=False) as f,
+    ):
+        _ = f.write(settings.csv_header + '\n')
+
+        for parsed in executor.map(parse_cached_race, race_urls, chunksize=16):
+            if parsed is None:
+                skipped += 1
                 continue
 
-            for row in race.csv_data:
+            for row in parsed:
                 _ = f.write(row + '\n')
 
-            _ = paths.progress.write_text(url)
+    if paths.progress.exists():
+        paths.progress.unlink()
 
-    print('Finished scraping.')
+    if skipped:
+        print(f'{skipped} races were not rebuilt, void, filtered out or not in the page cache.')
+
+    print('Finished rebuilding.')
     print(f'OUTPUT_CSV={paths.output.resolve()}')
 
 
+def parse_mode(parse_workers: int, parse_threads: int) -> tuple[int, bool]:
+    from utils.parsing import free_threaded
+
+    if not parse_threads:
+        return parse_workers, False
+
+    if free_threaded():
+        return parse_threads, True
+
+    print(f'The GIL is enabled, parsing in {parse_threads} processes instead of threads.')
+    return parse_threads, False
+
+
 def writer_csv(file_path: str, append: bool = False) -> TextIO:
     return open(file_path, 'a' if append else 'w', encoding='utf-8')
 
@@ -257,27 +470,74 @@ def main():
     args = parser.parse(sys.argv[1:])
     paths = build_paths(args.request, gzip_output)
 
+    parse_workers, parse_threads = parse_mode(args.parse_workers, args.parse_threads)
+
+    index = RaceIndex(CACHE_ROOT / 'races.db')
+
+    if args.rebuild:
+        course_ids = [course_id for course_id, _ in args.tracks]
+
+        if args.dates:
+            race_urls = index.date_urls(args.dates, set(course_ids), args.race_type)
+        else:
+            race_urls = index.course_year_urls(course_ids, args.years, args.race_type)
+
+        if not race_urls:
+            print('No indexed races for this request, run it once without --rebuild first.')
+            sys.exit(1)
+
+        rebuild_races(
+            sorted(set(race_urls), key=sort_key),
+            paths,
+            args.race_filter,
+            file_writer,
+            parse_workers,
+            parse_threads,
+        )
+        return
+
     if args.clean:
         clear_request(paths)
 
+    cache = PageCache(CACHE_ROOT / 'pages') if settings.toml.get('cache_pages', True) else None
+
     client = NetworkClient(
         email=os.getenv('EMAIL'),
         access_token=os.getenv('ACCESS_TOKEN'),
+        cache=cache,
+        limits=RateLimits.from_settings(settings.toml),
+        cookie_file=CACHE_ROOT / 'cookies.json',
     )
 
-    if args.dates != []:
-        race_urls = load_or_save_urls(
-            paths.urls,
-            lambda: get_race_urls_date(args.dates, args.tracks, client),
-        )
-
+    if args.window:
+        scrape_windows(args, paths, client, index, file_writer, parse_workers, parse_threads)
     else:
-        race_urls = load_or_save_urls(
-            paths.urls,
-            lambda: get_race_urls(args.years, args.tracks, args.race_type, client),
+        if args.dates != []:
+            html_parser = get_parser(settings.toml.get('html_parser', 'auto'))
+            race_urls = get_race_urls_date(
+                args.dates, args.tracks, args.race_type, client, index, html_parser, args.workers
+            )
+        else:
+            race_urls = get_race_urls(
+                args.years, args.tracks, args.race_type, client, index, args.workers
+            )
+
+        scrape_races(
+            race_urls,
+            paths,
+            args.race_filter,
+            client,
+            file_writer,
+            args.workers,
+            parse_workers,
+            parse_threads,
         )
 
-    scrape_races(race_urls, paths, args.race_type, client, file_writer)
+    print('Finished scraping.')
+    print(f'OUTPUT_CSV={paths.output.resolve()}')
+
+    if args.workers > 1:
+        print(f'Concurrency: {client.controller.summary()}')
 
 
 if __name__ == '__main__':
@@ -23,6 +23,7 @@ from utils.region import (
     valid_region,
     region_search,
 )
+from utils.race_filter import RaceFilter, split_terms
 
 
 class ParsedRequest(NamedTuple):
@@ -32,6 +33,12 @@ class ParsedRequest(NamedTuple):
     tracks: list[tuple[str, str]]
     race_type: str
     clean: bool
+    rebuild: bool
+    workers: int
+    parse_workers: int
+    parse_threads: int
+    race_filter: RaceFilter
+    window: int
 
 
 class ParsedArgs(NamedTuple):
@@ -72,6 +79,29 @@ class ArgParser:
             choices={'flat', 'jumps'},
             help='Race type',
         )
+        _ = self.parser.add_argument(
+            '--class',
+            dest='race_class',
+            metavar='N[,N]',
+            help='Only races of these classes, e.g. 1 or 1,2',
+        )
+        _ = self.parser.add_argument(
+            '--min-dist',
+            type=float,
+            default=0.0,
+            metavar='FURLONGS',
+            help='Only races of at least this distance in furlongs',
+        )
+        _ = self.parser.add_argument(
+            '--going',
+            metavar='TERM[,TERM]',
+            help='Only races whose going contains one of these terms, e.g. soft or good,firm',
+        )
+        _ = self.parser.add_argument(
+            '--pattern',
+            metavar='TERM[,TERM]',
+            help='Only races whose pattern contains one of these terms, e.g. group 1 or listed',
+        )
         _ = self.parser.add_argument(
             '--date-file',
             metavar='PATH',
@@ -80,7 +110,40 @@ class ArgParser:
         _ = self.parser.add_argument(
             '--clean',
             action='store_true',
-            help='Fully reset this request (clear cache and output) before running',
+            help='Reset this request (clear its progress and output) before running',
+        )
+        _ = self.parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rebuild the output from cached pages using current settings, without the network',
+        )
+        _ = self.parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            metavar='N',
+            help='Number of race pages to fetch concurrently',
+        )
+        _ = self.parser.add_argument(
+            '--parse-workers',
+            type=int,
+            default=0,
+            metavar='N',
+            help='Parse race pages in N worker processes while fetching (default: parse inline)',
+        )
+        _ = self.parser.add_argument(
+            '--parse-threads',
+            type=int,
+            default=0,
+            metavar='N',
+            help='Parse race pages in N threads on a free-threaded Python, otherwise in processes',
+        )
+        _ = self.parser.add_argument(
+            '--window',
+            type=int,
+            default=0,
+            metavar='DAYS',
+            help='Find, fetch and write races DAYS days at a time, holding only one window in memory',
         )
 
         # search / listing helpers
@@ -141,9 +204,42 @@ class ArgParser:
             scope_value = region
             tracks = list(courses(region))
 
-        # ---------- race type ----------
+        if args.rebuild and args.clean:
+            self.parser.error('--rebuild cannot be used with --clean')
+
+        if args.workers < 1:
+            self.parser.error('--workers must be at least 1')
+
+        if args.parse_workers < 0 or args.parse_threads < 0:
+            self.parser.error('--parse-workers and --parse-threads cannot be negative')
+
+        if args.parse_workers and args.parse_threads:
+            self.parser.error('Choose either --parse-workers or --parse-threads, not both')
+
+        if args.window < 0:
+            self.parser.error('--window cannot be negative')
+
+        if args.window and args.rebuild:
+            self.parser.error('--window cannot be used with --rebuild')
+
+        # ---------- race type and filters ----------
         race_type = args.type or 'all'
 
+        classes = split_terms(args.race_class)
+        if any(c not in {'1', '2', '3', '4', '5', '6', '7'} for c in classes):
+            self.parser.error('--class takes class numbers 1-7, e.g. 1 or 1,2')
+
+        if args.min_dist < 0:
+            self.parser.error('--min-dist cannot be negative')
+
+        race_filter = RaceFilter(
+            race_type=race_type,
+            classes=frozenset(classes),
+            min_dist=args.min_dist,
+            going=split_terms(args.going),
+            patterns=split_terms(args.pattern),
+        )
+
         dates: list[date] = []
         years: list[str] = []
 
@@ -196,6 +292,7 @@ class ArgParser:
             end = f'{years[-1]}'
 
         filename = start if start == end else f'{start}_{end}'
+        filename += race_filter.suffix()
 
         request = RequestKey(
             scope_kind=scope_kind,
@@ -211,4 +308,10 @@ class ArgParser:
             tracks=tracks,
             race_type=race_type,
             clean=args.clean,
+            rebuild=args.rebuild,
+            workers=args.workers,
+            parse_workers=args.parse_workers,
+            parse_threads=args.parse_threads,
+            race_filter=race_filter,
+            window=args.window,
         )
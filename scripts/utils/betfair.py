@@ -1,113 +1,219 @@
 import csv
+import io
+import sys
 import time
 import curl_cffi
 
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from orjson import JSONDecodeError, dumps, loads
 from pathlib import Path
 from datetime import date, timedelta, datetime
+from threading import Lock
 
-from models.betfair import BSP, BSPMap
+from models.betfair import COLUMNS, MISSING, BSPMap, BSPRace, clean_name, parse_date_time, to_float
+from utils.betfair_cache import BetfairCache, settled
+from utils.betfair_match import exact_key
+from utils.files import write_atomic
+from utils.region import get_region
+from utils.throttle import RETRY_STATUSES, RateLimits, TokenBucket, backoff_delay, retry_after
+
+
+URL_BASE = 'https://promo.betfair.com/betfairsp/prices/dwbfprices'
+
+# course region to the region in Betfair's file names
+REGIONS = {
+    'GB': 'uk',
+    'IRE': 'ire',
+    'USA': 'usa',
+    'AUS': 'aus',
+    'FR': 'fr',
+    'UAE': 'uae',
+}
+
+
+class MissingFiles:
+    """Price files Betfair answered 404 for, only recorded once their date has settled."""
+
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self.lock: Lock = Lock()
+
+        try:
+            self.urls: set[str] = set(loads(path.read_bytes()))
+        except (OSError, JSONDecodeError):
+            self.urls = set()
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.urls
+
+    def add(self, url: str) -> None:
+        if not settled(url):
+            return
+
+        with self.lock:
+            self.urls.add(url)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self.lock:
+            data = dumps(sorted(self.urls))
+
+        write_atomic(self.path, data)
 
 
 class Betfair:
-    def __init__(self, race_urls: list[str]):
+    """Betfair data for the races in a request, grouped by (region, date, off)."""
+
+    def __init__(
+        self,
+        race_urls: list[str],
+        cache: BetfairCache,
+        workers: int = 1,
+        limits: RateLimits | None = None,
+        missing: MissingFiles | None = None,
+        fetch: bool = True,
+    ):
         self.urls: list[tuple[str, str]] = create_urls(race_urls)
         self.data: BSPMap = {}
-        self.rows: list[BSP] = []
+        self.uncached: list[tuple[str, str]] = []
 
         for url, region in self.urls:
-            rows = get_data(url, region)
+            content = cache.get(url)
 
-            if not rows:
-                continue
+            if content is not None:
+                parse_file(content, region, self.data)
+            elif missing is None or url not in missing:
+                self.uncached.append((url, region))
 
-            self.rows.extend(rows)
+        if not fetch:
+            return
 
-            for row in rows:
-                key = (row.region, row.date, row.off)
-                self.data.setdefault(key, []).append(row)
+        for (_, region), content in zip(
+            self.uncached, download(self.uncached, workers, limits or RateLimits(), cache, missing)
+        ):
+            if content is not None:
+                parse_file(content, region, self.data)
 
-    @classmethod
-    def from_csv(cls, path: Path) -> 'Betfair':
-        self = cls.__new__(cls)
+        self.uncached = []
 
-        self.urls = []
-        self.data = {}
-        self.rows = []
 
-        with open(path, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+def create_urls(race_urls: list[str]) -> list[tuple[str, str]]:
+    """Price files for the day of each race and the days either side, in its region."""
+    needed: set[tuple[date, str]] = set()
 
-            for record in reader:
-                bsp = BSP.from_csv(record)
-                if not bsp:
-                    continue
+    for url in race_urls:
+        parts = url.split('/')
+        region = REGIONS.get(get_region(parts[4]))
+        if region is None:
+            continue
 
-                self.rows.append(bsp)
+        race_date = datetime.strptime(parts[6], '%Y-%m-%d').date()
+        for offset in (-1, 0, 1):
+            needed.add((race_date + timedelta(days=offset), region))
 
-                key = (bsp.region, bsp.date, bsp.off)
-                self.data.setdefault(key, []).append(bsp)
+    return [
+        (f'{URL_BASE}{region}win{d.strftime("%d%m%Y")}.csv', region.upper())
+        for d, region in sorted(needed)
+    ]
 
-        return self
 
+def download(
+    urls: list[tuple[str, str]],
+    workers: int,
+    limits: RateLimits,
+    cache: BetfairCache,
+    missing: MissingFiles | None = None,
+) -> Iterator[bytes | None]:
+    """Fetch and cache price files, yielding their content in url order, None for a 404."""
+    bucket = TokenBucket(limits.requests_per_second, limits.burst)
 
-def create_date_range(date_start: str, date_end: str) -> list[date]:
-    start = datetime.strptime(date_start, '%Y-%m-%d').date() - timedelta(days=1)
-    end = datetime.strptime(date_end, '%Y-%m-%d').date() + timedelta(days=1)
+    def fetch(url: str) -> bytes | None:
+        content = get_file(url, bucket, limits)
 
-    dates: list[date] = []
-    current = start
-    while current <= end:
-        dates.append(current)
-        current += timedelta(days=1)
+        if content is not None:
+            cache.put(url, content)
+        elif missing is not None:
+            missing.add(url)
 
-    return dates
+        return content
 
+    executor = ThreadPoolExecutor(max(workers, 1))
 
-def create_urls(race_urls: list[str]) -> list[tuple[str, str]]:
-    url_base = 'https://promo.betfair.com/betfairsp/prices/dwbfprices'
-    regions = ['uk', 'ire', 'usa', 'aus', 'fr', 'uae']
+    try:
+        futures = [executor.submit(fetch, url) for url, _ in urls]
 
-    dates = {x.split('/')[6] for x in race_urls}
-    date_start, date_end = min(dates), max(dates)
-    dates = create_date_range(date_start, date_end)
+        for future in futures:
+            yield future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
 
-    urls: list[tuple[str, str]] = []
+        if missing is not None:
+            missing.save()
 
-    for d in dates:
-        formatted = d.strftime('%d%m%Y')
-        for region in regions:
-            urls.append((f'{url_base}{region}win{formatted}.csv', region.upper()))
 
-    return urls
+def get_file(url: str, bucket: TokenBucket, limits: RateLimits) -> bytes | None:
+    resp: curl_cffi.Response | None = None
 
+    for attempt in range(limits.max_retries):
+        if attempt:
+            delay = retry_after(resp.headers) if resp is not None else None
+            if delay is None:
+                delay = backoff_delay(attempt - 1, limits.backoff_base, limits.backoff_max)
+            # the server is pushing back, hold every download not just this one
+            bucket.pause(delay)
 
-def get_data(url: str, region: str) -> list[BSP] | None:
-    resp = curl_cffi.get(url)
+        time.sleep(bucket.reserve())
+        resp = curl_cffi.get(url)
 
-    for _ in range(4):
         if resp.status_code == 404:
             return None
-        if resp.status_code == 429:
-            time.sleep(10)
-            resp = curl_cffi.get(url)
-            continue
-        if resp.status_code == 520:
-            time.sleep(10)
-            resp = curl_cffi.get(url)
-            continue
         if resp.status_code == 200:
-            break
-        raise RuntimeError(f'HTTP error {resp.status_code} for URL {url}')
+            return resp.content
+        if resp.status_code not in RETRY_STATUSES:
+            raise RuntimeError(f'HTTP error {resp.status_code} for URL {url}')
+
+    status = resp.status_code if resp is not None else None
+    raise RuntimeError(f'HTTP error {status} for URL {url}')
+
+
+def parse_file(content: bytes, region: str, data: BSPMap) -> None:
+    """Add the rows of a Betfair price file to data."""
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', newline=''))
 
-    if resp.status_code != 200:
-        raise RuntimeError(f'HTTP error {resp.status_code} for URL {url}')
+    header = next(reader, None)
+    if header is None:
+        return
 
-    reader = csv.DictReader(resp.content.decode().splitlines())
-    rows: list[BSP] = []
+    positions = {name: i for i, name in enumerate(header)}
+    if 'event_dt' not in positions or 'selection_name' not in positions:
+        return
+
+    event_dt = positions['event_dt']
+    selection_name = positions['selection_name']
+    columns = [positions.get(source) for source in COLUMNS.values()]
+    width = len(header)
+
+    region = 'GB' if region == 'UK' else region
 
     for record in reader:
-        bsp = BSP.from_record(record, region)
-        if bsp:
-            rows.append(bsp)
+        if len(record) < width:
+            record += [''] * (width - len(record))
+
+        parsed = parse_date_time(record[event_dt])
+        if not parsed:
+            continue
+
+        key = (region, *parsed)
+        race = data.get(key)
+        if race is None:
+            race = data[key] = BSPRace()
+
+        name = clean_name(record[selection_name], region)
 
-    return rows
+        race.append(
+            sys.intern(name),
+            exact_key(name),
+            [to_float(record[i]) if i is not None else MISSING for i in columns],
+        )
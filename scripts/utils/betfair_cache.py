@@ -0,0 +1,50 @@
+import gzip
+
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from time import time
+
+from utils.files import write_atomic
+from utils.page_cache import SETTLED_DAYS
+
+
+# Betfair fills in files for recent dates late, cached copies of those are refetched after this long
+RECENT_TTL = 6 * 60 * 60
+
+
+class BetfairCache:
+    """Raw Betfair price files, kept for good once fetched after their date settled."""
+
+    def __init__(self, root: Path) -> None:
+        self.root: Path = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def entry(self, url: str) -> Path:
+        return self.root / f'{url.rsplit("/", 1)[1]}.gz'
+
+    def get(self, url: str) -> bytes | None:
+        path = self.entry(url)
+
+        try:
+            fetched = path.stat().st_mtime
+            if not final(url, fetched) and time() - fetched > RECENT_TTL:
+                return None
+            return gzip.decompress(path.read_bytes())
+        except (OSError, EOFError):
+            return None
+
+    def put(self, url: str, content: bytes) -> None:
+        write_atomic(self.entry(url), gzip.compress(content, compresslevel=6))
+
+
+def file_date(url: str) -> date:
+    return datetime.strptime(url[-12:-4], '%d%m%Y').date()
+
+
+def settled(url: str) -> bool:
+    return file_date(url) <= date.today() - timedelta(days=SETTLED_DAYS)
+
+
+def final(url: str, fetched: float) -> bool:
+    # a copy fetched while Betfair was still filling the file stays on the TTL after the date settles
+    return date.fromtimestamp(fetched) >= file_date(url) + timedelta(days=SETTLED_DAYS)
@@ -0,0 +1,59 @@
+from collections.abc import Sequence
+from jarowinkler import jarowinkler_similarity
+
+
+SIMILARITY = 0.77
+
+
+def fuzzy_name(name: str) -> str:
+    return name.split('(')[0].strip().lower()
+
+
+def exact_key(name: str) -> str:
+    """Lowercased name without nationality, punctuation or spacing."""
+    return ''.join(char for char in fuzzy_name(name) if char.isalnum())
+
+
+def match_runners(horses: list[str], names: Sequence[str], keys: Sequence[str]) -> list[int | None]:
+    """Index in names of the Betfair row for each runner, None if there is no match."""
+    matches: list[int | None] = [None] * len(horses)
+
+    # names that agree once normalised are paired by lookup, only the rest are scored
+    by_key: dict[str, list[int]] = {}
+    for j, key in enumerate(keys):
+        by_key.setdefault(key, []).append(j)
+
+    unmatched: list[int] = []
+
+    for i, horse in enumerate(horses):
+        candidates = by_key.get(exact_key(horse))
+        if candidates:
+            matches[i] = candidates.pop(0)
+        else:
+            unmatched.append(i)
+
+    remaining = [j for candidates in by_key.values() for j in candidates]
+
+    if not unmatched or not remaining:
+        return matches
+
+    scored: list[tuple[float, int, int]] = []
+
+    for i in unmatched:
+        horse = fuzzy_name(horses[i])
+        for j in remaining:
+            score = jarowinkler_similarity(horse, names[j])
+            if score >= SIMILARITY:
+                scored.append((score, i, j))
+
+    # highest score first, ties in runner then name order
+    scored.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+
+    taken: set[int] = set()
+
+    for _, i, j in scored:
+        if matches[i] is None and j not in taken:
+            matches[i] = j
+            taken.add(j)
+
+    return matches
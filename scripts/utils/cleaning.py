@@ -1,4 +1,7 @@
-from re import search, sub, IGNORECASE
+import re
+
+RE_EMPTY_PARENS = re.compile(r'\(\s*\)+')
+RE_WHITESPACE = re.compile(r'\s+')
 
 RE_CLASS = r'(\(|\s)[Cc]lass (\d|[A-Ha-h])(\)|\s)'
 RE_GROUP = r'(\(|\s)(?:[Gg]rade|[Gg]roup) (\d|[A-Ca-c]|I*)(\)|\s)'
@@ -19,8 +22,8 @@ def clean_string(s: str) -> str:
     for char in [',', '"', "'", '\x80', '\\x80']:
         s = s.replace(char, '')
 
-    s = sub(r'\(\s*\)+', '', s)
-    s = sub(r'\s+', ' ', s)
+    s = RE_EMPTY_PARENS.sub('', s)
+    s = RE_WHITESPACE.sub(' ', s)
 
     return s.strip()
 
@@ -34,7 +37,7 @@ def clean_race(race_name: str) -> str:
 
     for key, regex in RE_PATTERNS:
         if key in lname:
-            if match := search(regex, name):
+            if match := re.search(regex, name):
                 return clean_string(name.replace(match.group(), '').strip())
 
     if 'listed' in lname:
@@ -0,0 +1,79 @@
+from hashlib import sha1
+from orjson import OPT_SORT_KEYS, dumps, loads, JSONDecodeError
+from pathlib import Path
+from time import time
+from typing import Any
+
+from curl_cffi import Session
+
+from utils.files import write_atomic
+
+
+# cookies set without an expiry are reused for this long before a new handshake
+SESSION_COOKIE_TTL = 12 * 60 * 60
+
+
+type SavedSession = dict[str, Any]
+
+
+class CookieStore:
+    """Handshake cookies saved between runs, keyed by the credentials they were made with."""
+
+    def __init__(self, path: Path, credentials: dict[str, str]) -> None:
+        self.path: Path = path
+        self.identity: str = sha1(dumps(credentials, option=OPT_SORT_KEYS)).hexdigest()
+
+    def load(self) -> list[SavedSession]:
+        try:
+            data = loads(self.path.read_bytes())
+        except (OSError, JSONDecodeError):
+            return []
+
+        if data.get('identity') != self.identity:
+            return []
+
+        now = time()
+        return [s for s in data.get('sessions', []) if s.get('expires', 0) > now]
+
+    def save(self, sessions: list[SavedSession]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        write_atomic(self.path, dumps({'identity': self.identity, 'sessions': sessions}))
+
+
+def export_cookies(
+    session: Session, exclude: set[str] | None = None
+) -> tuple[list[dict[str, Any]], float]:
+    """Session cookies less those in exclude, and when the earliest of them expires."""
+    cookies: list[dict[str, Any]] = []
+    expires = time() + SESSION_COOKIE_TTL
+
+    for cookie in session.cookies.jar:
+        if exclude and cookie.name in exclude:
+            continue
+
+        cookies.append(
+            {
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path,
+                'secure': cookie.secure,
+            }
+        )
+
+        if cookie.expires is not None:
+            expires = min(expires, float(cookie.expires))
+
+    return cookies, expires
+
+
+def import_cookies(session: Session, cookies: list[dict[str, Any]]) -> None:
+    for cookie in cookies:
+        session.cookies.set(
+            cookie['name'],
+            cookie['value'] or '',
+            domain=cookie['domain'],
+            path=cookie['path'],
+            secure=cookie['secure'],
+        )
@@ -1,30 +1,73 @@
 from collections.abc import Iterator
 from orjson import loads
+from threading import Lock
 
 
-_courses = loads(open('../courses/_courses', 'r').read())
+class CourseIndex:
+    """Course ids mapped to their region and name, read once from the courses file."""
+
+    def __init__(self, courses: dict[str, dict[str, str]]) -> None:
+        self.by_region: dict[str, dict[str, str]] = courses
+        self.names: dict[str, str] = courses.get('all', {})
+        self.regions: dict[str, str] = {}
+        self.known: set[str] = set()
+
+        for region, region_courses in courses.items():
+            self.known.update(region_courses)
+
+            if region == 'all':
+                continue
+
+            for course_id in region_courses:
+                _ = self.regions.setdefault(course_id, region.upper())
+
+        self.search_names: list[tuple[str, str, str]] = [
+            (name.lower(), course_id, name) for course_id, name in self.names.items()
+        ]
+
+    def search(self, term: str) -> Iterator[tuple[str, str]]:
+        term = term.lower()
+        for lower_name, course_id, name in self.search_names:
+            if term in lower_name:
+                yield course_id, name
+
+
+_index: CourseIndex | None = None
+_index_lock = Lock()
+
+
+def course_index() -> CourseIndex:
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                with open('../courses/_courses', 'rb') as f:
+                    _index = CourseIndex(loads(f.read()))
+
+    return _index
 
 
 def courses(code: str = 'all') -> Iterator[tuple[str, str]]:
-    for course_id, course in _courses[code].items():
+    for course_id, course in course_index().by_region[code].items():
         yield course_id, course
 
 
 def course_name(code: str) -> str:
     if code.isalpha():
         return code
-    for course in courses():
-        if course[0] == code:
-            return course[1].replace(' ', '-')
 
-    return ''
+    name = course_index().names.get(code)
+    return name.replace(' ', '-') if name is not None else ''
+
+
+def course_region(code: str) -> str:
+    return course_index().regions.get(code, '')
 
 
 def course_search(term: str):
-    term = term.lower()
-    for course_id, course_name in _courses['all'].items():
-        if term in course_name.lower():
-            print_course(course_id, course_name)
+    for course_id, course_name in course_index().search(term):
+        print_course(course_id, course_name)
 
 
 def print_course(code: str, course: str):
@@ -32,12 +75,12 @@ def print_course(code: str, course: str):
 
 
 def print_courses(code: str = 'all'):
-    for course_id, course_name in _courses[code].items():
+    for course_id, course_name in course_index().by_region[code].items():
         print_course(course_id, course_name)
 
 
 def valid_course(code: str) -> bool:
-    return any(code in region for region in _courses.values())
+    return code in course_index().known
 
 
 def valid_meeting(course: str):
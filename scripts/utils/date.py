@@ -60,3 +60,16 @@ def valid_years(years: list[str]):
         return all(year.isdigit() and 1987 <= int(year) <= int(datetime.today().year) for year in years)
 
     return False
+
+
+def date_windows(dates: list[date], days: int) -> list[list[date]]:
+    """Split sorted dates into runs that each span at most days calendar days."""
+    windows: list[list[date]] = []
+
+    for d in dates:
+        if windows and (d - windows[-1][0]).days < days:
+            windows[-1].append(d)
+        else:
+            windows.append([d])
+
+    return windows
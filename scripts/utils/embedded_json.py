@@ -0,0 +1,41 @@
+from orjson import JSONDecodeError, loads
+from typing import Any
+
+
+NEXT_DATA_ID = b'id="__NEXT_DATA__"'
+PRELOADED_STATE = b'window.PRELOADED_STATE ='
+
+
+def scan_next_data(content: bytes) -> Any | None:
+    """The __NEXT_DATA__ payload read from the page bytes, None if it is not found."""
+    marker = content.find(NEXT_DATA_ID)
+    if marker == -1:
+        return None
+
+    start = content.find(b'>', marker) + 1
+    end = content.find(b'</script>', start)
+    if start == 0 or end == -1:
+        return None
+
+    return _loads(content[start:end])
+
+
+def scan_preloaded_state(content: bytes) -> Any | None:
+    """The window.PRELOADED_STATE payload read from the page bytes, None if it is not found."""
+    marker = content.find(PRELOADED_STATE)
+    if marker == -1:
+        return None
+
+    start = marker + len(PRELOADED_STATE)
+    end = content.find(b'\n', start)
+    if end == -1:
+        return None
+
+    return _loads(content[start:end].strip().strip(b';'))
+
+
+def _loads(payload: bytes) -> Any | None:
+    try:
+        return loads(payload)
+    except JSONDecodeError:
+        return None
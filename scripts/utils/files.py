@@ -0,0 +1,19 @@
+import os
+
+from pathlib import Path
+from threading import get_ident
+
+
+def temp_path(path: Path) -> Path:
+    # unique per process and thread, so concurrent writers never share a temp file
+    return path.with_suffix(f'.{os.getpid()}.{get_ident()}.tmp')
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    tmp = temp_path(path)
+
+    try:
+        _ = tmp.write_bytes(data)
+        _ = tmp.replace(path)
+    finally:
+        tmp.unlink(missing_ok=True)
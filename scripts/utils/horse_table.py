@@ -0,0 +1,127 @@
+from lxml import etree
+from lxml.html import HtmlElement
+
+from utils.xpaths import HORSE_LINKS
+
+
+# elements read from each runner, keyed by data-test-selector, data-ending or class
+ROW_CELLS = {
+    'text-horsePosition',
+    'link-horseName',
+    'link-jockeyName',
+    'link-trainerName',
+    'link-silk',
+    'horse-age',
+    'st',
+    'lb',
+    'OR',
+    'RPR',
+    'TS',
+    'rp-horseTable__pos__draw',
+    'rp-horseTable__pos__length',
+    'rp-horseTable__saddleClothNo',
+    'rp-horseTable__horse__country',
+    'rp-horseTable__horse__price',
+    'rp-horseTable__headGear',
+    'rp-horseTable__silk',
+}
+
+
+class HorseTable:
+    """Cells of the horse table, one entry per runner row."""
+
+    def __init__(self, doc: HtmlElement) -> None:
+        self.positions: list[str] = []
+        self.draws: list[str] = []
+        self.lengths: list[HtmlElement | None] = []
+        self.numbers: list[str] = []
+        self.horses: list[str] = []
+        self.horse_links: list[str] = []
+        self.nationalities: list[str] = []
+        self.prices: list[str] = []
+        self.jockeys: list[str] = []
+        self.jockey_links: list[str] = []
+        self.trainers: list[str] = []
+        self.trainer_links: list[str] = []
+        self.owner_links: list[str] = []
+        self.silks: list[str] = []
+        self.ages: list[str] = []
+        self.stones: list[str] = []
+        self.pounds: list[str] = []
+        self.headgear: list[HtmlElement | None] = []
+        self.ofr: list[str] = []
+        self.rpr: list[str] = []
+        self.ts: list[str] = []
+        self.comments: list[str] = []
+        self.pedigrees: list[HtmlElement | None] = []
+
+        rows: list[HtmlElement] = []
+
+        for link in HORSE_LINKS(doc):
+            row = next(link.iterancestors('tr'), None)
+            if row is not None and (not rows or rows[-1] is not row):
+                rows.append(row)
+
+        runner_rows = set(rows)
+
+        for row in rows:
+            self.add_runner(row)
+
+            comment: HtmlElement | None = None
+            pedigree: HtmlElement | None = None
+
+            for sibling in row.itersiblings('tr'):
+                if sibling in runner_rows:
+                    break
+
+                if comment is None and 'rp-horseTable__commentRow' in sibling.get('class', ''):
+                    comment = sibling.find('td')
+                elif pedigree is None and (
+                    sibling.get('data-test-selector') == 'block-pedigreeInfoFullResults'
+                ):
+                    pedigree = sibling.find('td')
+
+            self.comments.append((comment.text or '') if comment is not None else '')
+            self.pedigrees.append(pedigree)
+
+    def add_runner(self, row: HtmlElement) -> None:
+        cells: dict[str, HtmlElement] = {}
+
+        for element in row.iter(etree.Element):
+            for key in (
+                element.get('data-test-selector'),
+                element.get('data-ending'),
+                element.get('class'),
+            ):
+                if key in ROW_CELLS and key not in cells:
+                    cells[key] = element
+
+        def text(key: str) -> str:
+            element = cells.get(key)
+            return (element.text or '') if element is not None else ''
+
+        def attrib(key: str, name: str) -> str:
+            element = cells.get(key)
+            return element.get(name, '') if element is not None else ''
+
+        self.positions.append(text('text-horsePosition'))
+        self.draws.append(text('rp-horseTable__pos__draw'))
+        self.lengths.append(cells.get('rp-horseTable__pos__length'))
+        self.numbers.append(text('rp-horseTable__saddleClothNo'))
+        self.horses.append(text('link-horseName'))
+        self.horse_links.append(attrib('link-horseName', 'href'))
+        self.nationalities.append(text('rp-horseTable__horse__country'))
+        self.prices.append(text('rp-horseTable__horse__price'))
+        self.jockeys.append(text('link-jockeyName'))
+        self.jockey_links.append(attrib('link-jockeyName', 'href'))
+        self.trainers.append(text('link-trainerName'))
+        self.trainer_links.append(attrib('link-trainerName', 'href'))
+        self.owner_links.append(attrib('link-silk', 'href'))
+        self.silks.append(attrib('rp-horseTable__silk', 'src'))
+        self.ages.append(text('horse-age'))
+        self.stones.append(text('st'))
+        self.pounds.append(text('lb'))
+        self.headgear.append(cells.get('rp-horseTable__headGear'))
+        self.ofr.append(text('OR'))
+        self.rpr.append(text('RPR'))
+        self.ts.append(text('TS'))
@@ -0,0 +1,84 @@
+import sys
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from lxml import etree, html
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+@dataclass(frozen=True)
+class Query:
+    """One selection in both CSS and XPath, so every backend runs its native form."""
+
+    css: str
+    xpath: etree.XPath
+
+
+COURSE_LINKS = Query(
+    'a[data-test-selector="link-listCourseNameLink"]',
+    etree.XPath('//a[@data-test-selector="link-listCourseNameLink"]'),
+)
+
+BODY_SCRIPTS = Query('body > script', etree.XPath('//body/script'))
+
+NEXT_DATA = Query('script#__NEXT_DATA__', etree.XPath('//script[@id="__NEXT_DATA__"]'))
+
+
+class HtmlParser(ABC):
+    name: str = ''
+
+    @abstractmethod
+    def attributes(self, content: bytes, query: Query, attrib: str) -> list[str]: ...
+
+    @abstractmethod
+    def texts(self, content: bytes, query: Query) -> list[str]: ...
+
+    def first_text(self, content: bytes, query: Query) -> str | None:
+        texts = self.texts(content, query)
+        return texts[0] if texts else None
+
+
+class LxmlParser(HtmlParser):
+    name = 'lxml'
+
+    def attributes(self, content: bytes, query: Query, attrib: str) -> list[str]:
+        doc = html.fromstring(content)
+        return [element.get(attrib, '') for element in query.xpath(doc)]
+
+    def texts(self, content: bytes, query: Query) -> list[str]:
+        doc = html.fromstring(content)
+        return [element.text_content() for element in query.xpath(doc)]
+
+
+class LexborParser(HtmlParser):
+    name = 'lexbor'
+
+    def attributes(self, content: bytes, query: Query, attrib: str) -> list[str]:
+        tree = LexborHTMLParser(content)
+        return [node.attributes.get(attrib) or '' for node in tree.css(query.css)]
+
+    def texts(self, content: bytes, query: Query) -> list[str]:
+        tree = LexborHTMLParser(content)
+        return [node.text() for node in tree.css(query.css)]
+
+
+def get_parser(name: str = 'auto') -> HtmlParser:
+    """'auto' picks lexbor when selectolax is installed and lxml otherwise."""
+    if name == 'auto':
+        name = 'lexbor' if LexborHTMLParser is not None else 'lxml'
+
+    if name == 'lexbor':
+        if LexborHTMLParser is None:
+            print('html_parser = "lexbor" needs selectolax installed, using lxml.')
+            return LxmlParser()
+        return LexborParser()
+
+    if name == 'lxml':
+        return LxmlParser()
+
+    print(f'Unknown html_parser: {name}, expected auto, lexbor or lxml.')
+    sys.exit(1)
@@ -1,5 +1,13 @@
+from functools import cache
 from lxml.html import HtmlElement
 
+from utils.xpaths import Selector
+
+
+@cache
+def selector(tag: str, value: str, property: str = 'data-test-selector') -> Selector:
+    return Selector(f'descendant::{tag}[@{property}="{value}"][1]')
+
 
 def find(
     doc: HtmlElement,
@@ -8,7 +16,7 @@ def find(
     property: str = 'data-test-selector',
     attrib: str | None = None,
 ) -> str:
-    element = doc.find(f'.//{tag}[@{property}="{value}"]')
+    element = find_element(doc, tag, value, property)
     if element is None:
         return ''
     if attrib:
@@ -22,4 +30,5 @@ def find_element(
     value: str,
     property: str = 'data-test-selector',
 ) -> HtmlElement | None:
-    return doc.find(f'.//{tag}[@{property}="{value}"]')
+    elements = selector(tag, value, property)(doc)
+    return elements[0] if elements else None
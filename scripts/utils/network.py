@@ -1,8 +1,25 @@
-from collections.abc import Sequence
-from curl_cffi import Session, Response, BrowserTypeLiteral
-from random import choice
+import asyncio
+
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from curl_cffi import AsyncSession, Session, Response, BrowserTypeLiteral
+from curl_cffi.requests.exceptions import ConnectionError, Timeout
+from queue import Queue
+from random import choice, sample
+from threading import Event, Lock, Semaphore, Thread
 from time import sleep
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit
+
+from utils.cookie_store import CookieStore, SavedSession, export_cookies, import_cookies
+from utils.page_cache import CachedResponse, PageCache, is_settled_result
+from utils.throttle import (
+    RETRY_STATUSES,
+    ConcurrencyController,
+    RateLimits,
+    TokenBucket,
+    backoff_delay,
+    retry_after,
+)
 
 
 class Persistent406Error(Exception):
@@ -19,6 +36,11 @@ BROWSERS: Sequence[BrowserTypeLiteral] = (
 
 COGNITO_POOL = '3fii107m4bmtggnm21pud2es21'
 
+SET_COOKIES_URL = 'https://www.racingpost.com/api/auth/set-cookies'
+
+
+type FetchResult = tuple[str, int, Response | CachedResponse]
+
 
 def construct_cookies(email: str | None, access_token: str | None) -> dict[str, str]:
     if email is None or access_token is None:
@@ -31,6 +53,127 @@ def construct_cookies(email: str | None, access_token: str | None) -> dict[str,
     }
 
 
+class PooledSession:
+    def __init__(
+        self,
+        cookies: dict[str, str],
+        impersonate: BrowserTypeLiteral,
+        saved: SavedSession | None = None,
+    ) -> None:
+        self.impersonate: BrowserTypeLiteral = impersonate
+        self.session: Session = Session(impersonate=self.impersonate, cookies=cookies)
+        self.credentials: set[str] = set(cookies)
+        self.rejections: int = 0
+        self.expires: float = 0.0
+        self.restored: bool = saved is not None
+        # bumped on every handshake, so copies of the cookies can tell they are out of date
+        self.generation: int = 0
+        self.handshake_lock: Lock = Lock()
+
+        if saved is not None:
+            import_cookies(self.session, saved['cookies'])
+            self.expires = saved['expires']
+        else:
+            self.handshake()
+
+    def handshake(self) -> None:
+        _ = self.session.get(SET_COOKIES_URL)
+        _, self.expires = export_cookies(self.session)
+        self.restored = False
+        self.generation += 1
+
+    def export(self) -> SavedSession:
+        # credentials come from the environment on every run, they are not written out
+        cookies, _ = export_cookies(self.session, exclude=self.credentials)
+        return {'impersonate': self.impersonate, 'cookies': cookies, 'expires': self.expires}
+
+
+class SessionPool:
+    """Sessions used round robin, one that keeps drawing 406s is replaced."""
+
+    def __init__(
+        self,
+        size: int,
+        cookies: dict[str, str],
+        max_rejections: int = 3,
+        store: CookieStore | None = None,
+    ) -> None:
+        self.cookies: dict[str, str] = cookies
+        self.max_rejections: int = max_rejections
+        self.store: CookieStore | None = store
+        self.retired: int = 0
+        self.index: int = 0
+        self.lock: Lock = Lock()
+
+        saved = store.load() if store is not None else []
+        profiles = sample(BROWSERS, len(BROWSERS))
+
+        self.sessions: list[PooledSession] = []
+
+        for i in range(max(size, 1)):
+            if i < len(saved):
+                pooled = PooledSession(cookies, saved[i]['impersonate'], saved[i])
+            else:
+                pooled = PooledSession(cookies, profiles[i % len(profiles)])
+            self.sessions.append(pooled)
+
+        if len(saved) < len(self.sessions):
+            self.save()
+
+    def next(self) -> PooledSession:
+        with self.lock:
+            pooled = self.sessions[self.index % len(self.sessions)]
+            self.index += 1
+            return pooled
+
+    def accepted(self, pooled: PooledSession) -> None:
+        pooled.rejections = 0
+
+    def rejected(self, pooled: PooledSession) -> None:
+        with self.lock:
+            pooled.rejections += 1
+
+            if pooled.rejections < self.max_rejections or pooled not in self.sessions:
+                return
+
+            self.sessions.remove(pooled)
+            self.retired += 1
+
+        profile = choice([b for b in BROWSERS if b != pooled.impersonate])
+        replacement = PooledSession(self.cookies, profile)
+        pooled.session.close()
+
+        with self.lock:
+            self.sessions.append(replacement)
+
+        self.save()
+
+    def refresh(self, pooled: PooledSession, generation: int) -> bool:
+        """Redo the handshake of a restored session, False if there is nothing to refresh."""
+        with pooled.handshake_lock:
+            # another request redid the handshake after this one was sent, a retry is enough
+            if pooled.generation != generation:
+                return True
+
+            if not pooled.restored:
+                return False
+
+            pooled.handshake()
+
+        self.save()
+
+        return True
+
+    def save(self) -> None:
+        if self.store is None:
+            return
+
+        with self.lock:
+            sessions = [pooled.export() for pooled in self.sessions]
+
+        self.store.save(sessions)
+
+
 class NetworkClient:
     def __init__(
         self,
@@ -38,32 +181,282 @@ class NetworkClient:
         email: str | None = None,
         access_token: str | None = None,
         timeout: int = 14,
+        cache: PageCache | None = None,
+        limits: RateLimits | None = None,
+        cookie_file: Path | None = None,
     ) -> None:
+        self.timeout: int = timeout
+        self.cache: PageCache | None = cache
+        self.limits: RateLimits = limits or RateLimits()
+
         cookies = construct_cookies(email, access_token)
+        store = CookieStore(cookie_file, cookies) if cookie_file is not None else None
 
-        self.session: Session = Session(impersonate=choice(BROWSERS), cookies=cookies)
-        self.timeout: int = timeout
+        self.pool: SessionPool = SessionPool(
+            self.limits.sessions,
+            cookies,
+            self.limits.session_rejections,
+            store,
+        )
 
-        _ = self.session.get('https://www.racingpost.com/api/auth/set-cookies')
+        self.buckets: dict[str, TokenBucket] = {}
+        self.buckets_lock: Lock = Lock()
+        self.controller: ConcurrencyController = ConcurrencyController(self.limits.autotune)
 
     def get(
         self,
         url: str,
         allow_redirects: bool = True,
-        retries: int = 7,
-        delay: float = 1.4,
-    ) -> tuple[int, Response]:
-        for attempt in range(1, retries):
-            response = self.session.get(
-                url,
-                allow_redirects=allow_redirects,
-                timeout=self.timeout,
-            )
+        use_cache: bool = True,
+    ) -> tuple[int, Response | CachedResponse]:
+        if use_cache and (cached := self.from_cache(url)):
+            return cached
+
+        response: Response | None = None
+        refreshed: PooledSession | None = None
+
+        for attempt in range(self.limits.max_retries):
+            if attempt:
+                sleep(self.retry_delay(url, attempt - 1, response))
+
+            sleep(self.bucket(url).reserve())
+
+            # a request rejected for stale cookies is retried on the session that was refreshed
+            pooled = refreshed or self.pool.next()
+            refreshed = None
+            generation = pooled.generation
+
+            try:
+                response = pooled.session.get(
+                    url,
+                    allow_redirects=allow_redirects,
+                    timeout=self.timeout,
+                )
+            except (ConnectionError, Timeout):
+                if attempt == self.limits.max_retries - 1:
+                    raise
+                response = None
+                continue
+
+            if self.track(pooled, generation, response):
+                refreshed = pooled
+                continue
+
+            if response.status_code not in RETRY_STATUSES:
+                self.controller.success()
+                self.to_cache(url, response)
+                return response.status_code, response
+
+        return self.exhausted(url, response)
+
+    def get_many(self, urls: Sequence[str], workers: int = 1) -> Iterator[FetchResult]:
+        """Fetch urls with up to workers in flight, yielding (url, status, response) in url order."""
+        if workers <= 1:
+            for url in urls:
+                status, response = self.get(url)
+                yield url, status, response
+            return
+
+        self.controller.set_ceiling(workers)
+
+        # completed responses are buffered until every earlier url has been yielded,
+        # the window bounds how far ahead of the consumer the fetcher may run
+        window = Semaphore(workers * 4)
+        stop = Event()
+        results: Queue[tuple[int, int, Response | CachedResponse] | BaseException] = Queue()
+
+        thread = Thread(
+            target=asyncio.run,
+            args=(self._fetch_all(urls, window, stop, results),),
+            daemon=True,
+        )
+        thread.start()
+
+        pending: dict[int, tuple[int, Response | CachedResponse]] = {}
+        next_index = 0
+
+        try:
+            while next_index < len(urls):
+                item = results.get()
+
+                if isinstance(item, BaseException):
+                    raise item
+
+                index, status, response = item
+                pending[index] = (status, response)
+
+                while next_index in pending:
+                    status, response = pending.pop(next_index)
+                    yield urls[next_index], status, response
+                    window.release()
+                    next_index += 1
+        finally:
+            stop.set()
+            window.release()
+            thread.join()
+
+    async def _fetch_all(
+        self,
+        urls: Sequence[str],
+        window: Semaphore,
+        stop: Event,
+        results: Queue[tuple[int, int, Response | CachedResponse] | BaseException],
+    ) -> None:
+        tasks: set[asyncio.Task[None]] = set()
+
+        # async sessions mirror the pooled sessions, one per handshake, sharing their profile and cookies
+        async_sessions: dict[tuple[PooledSession, int], AsyncSession] = {}
+
+        async def fetch(index: int, url: str) -> None:
+            try:
+                status, response = await self._get_async(async_sessions, url)
+                results.put((index, status, response))
+            except Exception as e:
+                stop.set()
+                results.put(e)
+            finally:
+                self.controller.release()
+
+        try:
+            for index, url in enumerate(urls):
+                while not await asyncio.to_thread(window.acquire, timeout=0.5):
+                    if stop.is_set():
+                        break
+
+                if stop.is_set():
+                    break
+
+                # slots are shared with any other get_many running on this client
+                acquired = self.controller.acquire(0)
+                while not acquired and not stop.is_set():
+                    acquired = await asyncio.to_thread(self.controller.acquire, 0.5)
+
+                if not acquired:
+                    break
+
+                task = asyncio.create_task(fetch(index, url))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            _ = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for session in async_sessions.values():
+                await session.close()
+
+    async def _get_async(
+        self,
+        async_sessions: dict[tuple[PooledSession, int], AsyncSession],
+        url: str,
+        allow_redirects: bool = True,
+    ) -> tuple[int, Response | CachedResponse]:
+        if cached := self.from_cache(url):
+            return cached
 
-            if response.status_code != 406:
+        response: Response | None = None
+        refreshed: PooledSession | None = None
+
+        for attempt in range(self.limits.max_retries):
+            if attempt:
+                await asyncio.sleep(self.retry_delay(url, attempt - 1, response))
+
+            await asyncio.sleep(self.bucket(url).reserve())
+
+            # a request rejected for stale cookies is retried on the session that was refreshed
+            pooled = refreshed or self.pool.next()
+            refreshed = None
+            generation = pooled.generation
+
+            # a handshake gives the session new cookies, the async copy is rebuilt from them
+            key = (pooled, generation)
+            if key not in async_sessions:
+                async_sessions[key] = AsyncSession(
+                    impersonate=pooled.impersonate,
+                    cookies=pooled.session.cookies,
+                )
+
+            try:
+                response = await async_sessions[key].get(
+                    url,
+                    allow_redirects=allow_redirects,
+                    timeout=self.timeout,
+                )
+            except (ConnectionError, Timeout):
+                if attempt == self.limits.max_retries - 1:
+                    raise
+                response = None
+                continue
+
+            if await asyncio.to_thread(self.track, pooled, generation, response):
+                refreshed = pooled
+                continue
+
+            if response.status_code not in RETRY_STATUSES:
+                self.controller.success()
+                self.to_cache(url, response)
                 return response.status_code, response
 
-            if attempt < retries:
-                sleep(delay)
+        return self.exhausted(url, response)
+
+    def track(self, pooled: PooledSession, generation: int, response: Response) -> bool:
+        """Record the response against the session, True if it should be sent again."""
+        if response.status_code in {401, 403}:
+            return self.pool.refresh(pooled, generation)
+
+        if response.status_code == 406:
+            self.pool.rejected(pooled)
+        else:
+            self.pool.accepted(pooled)
+
+        return False
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(
+                    self.limits.requests_per_second,
+                    self.limits.burst,
+                )
+            return self.buckets[host]
+
+    def retry_delay(self, url: str, attempt: int, response: Response | None) -> float:
+        delay = retry_after(response.headers) if response is not None else None
+
+        if delay is None:
+            delay = backoff_delay(attempt, self.limits.backoff_base, self.limits.backoff_max)
+
+        # the site is pushing back, slow every request to this host not just this one
+        if response is None or response.status_code in {406, 429}:
+            self.controller.congestion()
+
+            if response is not None:
+                self.bucket(url).pause(delay)
+
+        return delay
+
+    def exhausted(self, url: str, response: Response | None) -> tuple[int, Response]:
+        assert response is not None
+
+        if response.status_code == 406:
+            raise Persistent406Error(
+                f'received 406 for {self.limits.max_retries} attempts on {url}'
+            )
+
+        return response.status_code, response
+
+    def from_cache(self, url: str) -> tuple[int, CachedResponse] | None:
+        if self.cache is None or not is_settled_result(url):
+            return None
+
+        content = self.cache.get(url)
+        if content is None:
+            return None
+
+        return 200, CachedResponse(url, content)
+
+    def to_cache(self, url: str, response: Response) -> None:
+        if self.cache is None or response.status_code != 200 or not is_settled_result(url):
+            return
 
-        raise Persistent406Error(f'received 406 for {retries} attempts on {url}')
+        self.cache.put(url, response.content)
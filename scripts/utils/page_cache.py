@@ -0,0 +1,173 @@
+import gzip
+import os
+import zlib
+
+from datetime import date, timedelta
+from hashlib import sha1
+from orjson import loads
+from pathlib import Path
+from re import search
+from threading import Lock
+from typing import Any
+
+from utils.files import temp_path, write_atomic
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# a damaged entry or one written with another dictionary is treated as a cache miss
+DECODE_ERRORS: tuple[type[Exception], ...] = (OSError, EOFError, zlib.error)
+if zstandard is not None:
+    DECODE_ERRORS += (zstandard.ZstdError,)
+
+
+DICT_SAMPLES = 256
+DICT_SIZE = 112_640
+
+# results are occasionally amended shortly after a race, only pages older than this are kept
+SETTLED_DAYS = 3
+
+
+class CachedResponse:
+    def __init__(self, url: str, content: bytes, status_code: int = 200) -> None:
+        self.url: str = url
+        self.content: bytes = content
+        self.status_code: int = status_code
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return loads(self.content)
+
+
+class PageCache:
+    """Compressed raw responses keyed by url, zstd with a trained dictionary when available."""
+
+    def __init__(self, root: Path) -> None:
+        self.root: Path = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self.dict_path: Path = root / 'pages.dict'
+        self.samples: list[bytes] = []
+        self.lock: Lock = Lock()
+        # zstd decompressors must not be used from two threads at once
+        self.read_lock: Lock = Lock()
+
+        self.compressor: Any = None
+        self.decompressor: Any = None
+        # zstd frames record the id of the dictionary they were written with, 0 for none
+        self.dict_id: int = 0
+
+        if zstandard is not None:
+            self.load_dictionary()
+
+    def load_dictionary(self) -> None:
+        assert zstandard is not None
+
+        if self.dict_path.exists():
+            dict_data = zstandard.ZstdCompressionDict(self.dict_path.read_bytes())
+            self.dict_id = dict_data.dict_id()
+            self.compressor = zstandard.ZstdCompressor(
+                level=10, dict_data=dict_data, write_dict_id=True
+            )
+            self.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        else:
+            self.compressor = zstandard.ZstdCompressor(level=10)
+            self.decompressor = zstandard.ZstdDecompressor()
+
+    def entry(self, url: str) -> Path:
+        digest = sha1(url.encode()).hexdigest()
+        return self.root / digest[:2] / digest
+
+    def get(self, url: str) -> bytes | None:
+        """The cached page, None if it is missing or cannot be read back."""
+        entry = self.entry(url)
+
+        try:
+            zst = entry.with_suffix('.zst')
+            if self.decompressor is not None and zst.exists():
+                assert zstandard is not None
+
+                data = zst.read_bytes()
+                dict_id = zstandard.get_frame_parameters(data).dict_id
+                if dict_id not in (0, self.dict_id):
+                    return None
+
+                with self.read_lock:
+                    return self.decompressor.decompress(data)
+
+            gz = entry.with_suffix('.gz')
+            if gz.exists():
+                return gzip.decompress(gz.read_bytes())
+        except DECODE_ERRORS:
+            return None
+
+        return None
+
+    def put(self, url: str, content: bytes) -> None:
+        entry = self.entry(url)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+
+        with self.lock:
+            if self.compressor is not None:
+                path = entry.with_suffix('.zst')
+                data = self.compressor.compress(content)
+                self.collect_sample(content)
+            else:
+                path = entry.with_suffix('.gz')
+                data = gzip.compress(content, compresslevel=6)
+
+        write_atomic(path, data)
+
+    def collect_sample(self, content: bytes) -> None:
+        if zstandard is None or self.dict_path.exists():
+            return
+
+        self.samples.append(content)
+
+        if len(self.samples) < DICT_SAMPLES:
+            return
+
+        samples, self.samples = self.samples, []
+
+        try:
+            dict_data = zstandard.train_dictionary(DICT_SIZE, samples)
+        except zstandard.ZstdError:
+            return
+
+        # another run may be training one too, the first dictionary written is kept by both
+        tmp = temp_path(self.dict_path)
+        _ = tmp.write_bytes(dict_data.as_bytes())
+
+        try:
+            os.link(tmp, self.dict_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # no hard links on this filesystem, fall back to a plain replace
+            if not self.dict_path.exists():
+                _ = tmp.replace(self.dict_path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        self.load_dictionary()
+
+
+def is_settled_result(url: str) -> bool:
+    if '/results/' not in url:
+        return False
+
+    match = search(r'/(\d{4}-\d{2}-\d{2})(/|$)', url)
+    if not match:
+        return False
+
+    try:
+        race_date = date.fromisoformat(match.group(1))
+    except ValueError:
+        return False
+
+    return race_date <= date.today() - timedelta(days=SETTLED_DAYS)
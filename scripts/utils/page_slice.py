@@ -0,0 +1,74 @@
+import re
+
+from lxml import html
+from lxml.html import HtmlElement
+
+
+RE_SCRIPT = re.compile(rb'<script\b.*?</script\s*>', re.DOTALL | re.IGNORECASE)
+RE_DIV_TAG = re.compile(rb'<div\b|</div\s*>', re.IGNORECASE)
+
+RACE_HEADER = b'data-analytics-race-date-time'
+RACE_INFO = b'class="rp-raceInfo"'
+HORSE_LINK = b'data-test-selector="link-horseName"'
+
+# the slice loses the page head, so the charset has to be restated
+CHARSET = b'<meta charset="utf-8">'
+
+
+def parse_race_page(content: bytes) -> HtmlElement:
+    """Parse only the part of a results page Race reads, or the whole page if that fails."""
+    fragment = slice_race_page(content)
+
+    if fragment is None:
+        return html.fromstring(content)
+
+    return html.document_fromstring(CHARSET + fragment)
+
+
+def slice_race_page(content: bytes) -> bytes | None:
+    # scripts go first, markup quoted inside one must not move the cut
+    content = RE_SCRIPT.sub(b'', content)
+
+    header = content.find(RACE_HEADER)
+    if header == -1:
+        return None
+
+    start = content.rfind(b'<main', 0, header)
+    if start == -1:
+        return None
+
+    body = content[start:]
+
+    last_horse = body.rfind(HORSE_LINK)
+    if last_horse == -1:
+        return None
+
+    table_end = body.find(b'</table>', last_horse)
+    if table_end == -1:
+        return None
+
+    race_info = body.find(RACE_INFO)
+    if race_info == -1:
+        return None
+
+    race_info_end = closing_div(body, race_info)
+    if race_info_end == -1:
+        return None
+
+    return body[: max(table_end + len(b'</table>'), race_info_end)]
+
+
+def closing_div(content: bytes, pos: int) -> int:
+    """End offset of the div whose opening tag contains pos, -1 if unbalanced."""
+    start = content.rfind(b'<div', 0, pos)
+    depth = 0
+
+    for match in RE_DIV_TAG.finditer(content, start):
+        if match.group().startswith(b'</'):
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        else:
+            depth += 1
+
+    return -1
@@ -0,0 +1,120 @@
+import sys
+
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from models.betfair import BSPMap
+from utils.course import course_index
+from utils.page_cache import PageCache
+from utils.page_slice import parse_race_page
+from utils.race import FilteredRaceError, IncompleteRaceError, Race, VoidRaceError
+from utils.race_filter import RaceFilter
+
+
+# per process state, set once by init_worker so it is not pickled with every task
+_fields: list[str] = []
+_bsp_map: BSPMap | None = None
+_cache: PageCache | None = None
+_race_filter: RaceFilter | None = None
+
+
+type ParsedRace = list[str]
+
+
+def init_worker(
+    fields: list[str],
+    bsp_map: BSPMap | None,
+    race_filter: RaceFilter | None = None,
+    cache_root: Path | None = None,
+) -> None:
+    global _fields, _bsp_map, _race_filter, _cache
+
+    _fields = fields
+    _bsp_map = bsp_map
+    _race_filter = race_filter
+    _cache = PageCache(cache_root) if cache_root is not None else None
+
+    # load the course index now rather than on the first race
+    _ = course_index()
+
+
+def free_threaded() -> bool:
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def parse_executor(
+    workers: int,
+    threads: bool,
+    fields: list[str],
+    bsp_map: BSPMap | None,
+    race_filter: RaceFilter | None = None,
+    cache_root: Path | None = None,
+) -> Executor:
+    """Process pool for parsing, or a thread pool when threads is set."""
+    executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+
+    return executor(
+        workers or None,
+        initializer=init_worker,
+        initargs=(fields, bsp_map, race_filter, cache_root),
+    )
+
+
+def parse_race(url: str, content: bytes) -> ParsedRace | None:
+    """The csv rows of a results page, None if the race was void or filtered out."""
+    doc = parse_race_page(content)
+
+    try:
+        race = Race(None, url, doc, _fields, _bsp_map, _race_filter)
+    except (VoidRaceError, FilteredRaceError):
+        return None
+
+    return race.csv_data
+
+
+def parse_cached_race(url: str) -> ParsedRace | None:
+    assert _cache is not None
+
+    content = _cache.get(url)
+    if content is None:
+        return None
+
+    try:
+        return parse_race(url, content)
+    except IncompleteRaceError:
+        return None
+
+
+def parse_pages(
+    pages: Iterable[tuple[str, bytes]],
+    workers: int,
+    fields: list[str],
+    bsp_map: BSPMap | None,
+    incomplete: Callable[[str, bytes], ParsedRace | None],
+    threads: bool = False,
+    race_filter: RaceFilter | None = None,
+) -> Iterator[tuple[str, ParsedRace | None]]:
+    """Parse pages in a pool as they arrive, yielding (url, parsed) in arrival order."""
+    # a few pages per worker at most, so a slow parse also slows fetching
+    max_pending = workers * 4
+    pending: deque[tuple[str, bytes, Future[ParsedRace | None]]] = deque()
+
+    def completed() -> tuple[str, ParsedRace | None]:
+        url, content, future = pending.popleft()
+        try:
+            return url, future.result()
+        except IncompleteRaceError:
+            return url, incomplete(url, content)
+
+    with parse_executor(workers, threads, fields, bsp_map, race_filter) as executor:
+        for url, content in pages:
+            pending.append((url, content, executor.submit(parse_race, url, content)))
+
+            if len(pending) >= max_pending:
+                yield completed()
+
+        while pending:
+            yield completed()
@@ -2,6 +2,10 @@ from pathlib import Path
 from dataclasses import dataclass
 
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+CACHE_ROOT = PROJECT_ROOT / '.cache'
+
+
 @dataclass(frozen=True)
 class RequestKey:
     scope_kind: str
@@ -20,32 +24,24 @@ class RequestKey:
 class Paths:
     output: Path
     progress: Path
-    urls: Path
-    betfair: Path
 
 
 def build_paths(
     request: RequestKey,
     gzip_output: bool = False,
 ) -> Paths:
-    project_root = Path(__file__).resolve().parents[2]
-
-    data_root = project_root / 'data'
-    cache_root = project_root / '.cache'
+    data_root = PROJECT_ROOT / 'data'
+    cache_root = CACHE_ROOT
 
     ext = '.csv.gz' if gzip_output else '.csv'
 
     output = data_root / request.typed_dir() / f'{request.filename}{ext}'
     progress = cache_root / 'progress' / request.typed_dir() / f'{request.filename}.progress'
-    urls = cache_root / 'urls' / request.scoped_dir() / f'{request.filename}.csv'
-    betfair = cache_root / 'betfair' / f'{request.filename}.csv'
 
-    for path in (output, progress, urls, betfair):
+    for path in (output, progress):
         path.parent.mkdir(parents=True, exist_ok=True)
 
     return Paths(
         output=output,
         progress=progress,
-        urls=urls,
-        betfair=betfair,
     )
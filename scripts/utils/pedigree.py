@@ -7,8 +7,8 @@ from utils.cleaning import clean_string
 
 
 class Pedigree:
-    def __init__(self, pedigrees: list[HtmlElement]) -> None:
-        self.pedigrees: list[HtmlElement] = pedigrees
+    def __init__(self, pedigrees: list[HtmlElement | None]) -> None:
+        self.pedigrees: list[HtmlElement | None] = pedigrees
         self.dams: list[str] = []
         self.damsires: list[str] = []
         self.sires: list[str] = []
@@ -70,6 +70,18 @@ class Pedigree:
 
     def pedigree_info(self) -> None:
         for pedigree in self.pedigrees:
+            if pedigree is None:
+                for collection in (
+                    self.sires,
+                    self.id_sires,
+                    self.dams,
+                    self.id_dams,
+                    self.damsires,
+                    self.id_damsires,
+                ):
+                    collection.append('')
+                continue
+
             ped_info: list[HtmlElement] = pedigree.findall('a')
             has_sire: bool = '-' in pedigree.text_content()
 
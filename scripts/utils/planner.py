@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field
+from datetime import date
+
+from utils.race_index import RaceIndex
+
+
+type CourseYear = tuple[str, str, str, str]
+
+
+@dataclass
+class DiscoveryPlan:
+    strategy: str
+    dates: list[date] = field(default_factory=list)
+    course_years: list[CourseYear] = field(default_factory=list)
+
+    @property
+    def cost(self) -> int:
+        return len(self.dates) + len(self.course_years)
+
+
+def plan_discovery(
+    dates: list[date],
+    tracks: list[tuple[str, str]],
+    race_type: str,
+    index: RaceIndex,
+) -> DiscoveryPlan:
+    """Date pages or course listings, whichever needs fewer requests."""
+    by_date = DiscoveryPlan(
+        'dates',
+        dates=[race_date for race_date in dates if not index.has_date(race_date)],
+    )
+
+    by_course = DiscoveryPlan(
+        'course_years',
+        course_years=[
+            (course_id, course, year, listing_type)
+            for listing_type, years in listing_years(dates, race_type).items()
+            for course_id, course in tracks
+            for year in years
+            if not index.has_course_year(course_id, year, listing_type)
+        ],
+    )
+
+    return by_course if by_course.cost < by_date.cost else by_date
+
+
+def listing_years(dates: list[date], race_type: str) -> dict[str, list[str]]:
+    """Years of the course listings covering the dates, for each race type."""
+    years = {d.year for d in dates}
+    types = ('flat', 'jumps') if race_type == 'all' else (race_type,)
+
+    listings: dict[str, list[str]] = {}
+
+    for listing_type in types:
+        if listing_type == 'jumps':
+            seasons = years | {year - 1 for year in years}
+        else:
+            seasons = years
+        listings[listing_type] = [str(year) for year in sorted(seasons)]
+
+    return listings
@@ -1,17 +1,22 @@
 import sys
 
+from curl_cffi import Response
 from typing import Any, NoReturn
 from orjson import loads
-from lxml import html
 
+from utils.embedded_json import scan_preloaded_state
+from utils.html_parser import BODY_SCRIPTS, HtmlParser
 from utils.network import NetworkClient
+from utils.page_cache import CachedResponse
 
 
-def get_profiles(client: NetworkClient, urls: list[str]) -> dict[str, dict[str, Any]]:
+def get_profiles(
+    client: NetworkClient, urls: list[str], html_parser: HtmlParser, workers: int = 1
+) -> dict[str, dict[str, Any]]:
     profiles: dict[str, dict[str, Any]] = {}
 
-    for url in urls:
-        profile = _extract_profile_from_url(client, url)
+    for url, status, response in client.get_many(urls, workers):
+        profile = _extract_profile(url, status, response, html_parser)
         split = url.split('/')
 
         profile['profile']['profile'] = f'{split[5]}/{split[6]}'
@@ -22,20 +27,22 @@ def get_profiles(client: NetworkClient, urls: list[str]) -> dict[str, dict[str,
     return profiles
 
 
-def _extract_profile_from_url(client: NetworkClient, url: str) -> dict[str, Any] | NoReturn:
-    status, response = client.get(url)
-
+def _extract_profile(
+    url: str, status: int, response: Response | CachedResponse, html_parser: HtmlParser
+) -> dict[str, Any] | NoReturn:
     if status != 200:
         _exit_with_error(f'Failed to get profiles.\nStatus: {status}, URL: {url}')
 
-    doc = html.fromstring(response.content)
+    # the state is one line of a script, finding it in the bytes avoids building a document
+    if (profile_data := scan_preloaded_state(response.content)) is not None:
+        return profile_data
 
     try:
-        script_elements = doc.xpath('//body/script')
-        if not script_elements:
+        script = html_parser.first_text(response.content, BODY_SCRIPTS)
+        if script is None:
             raise IndexError('No script elements found')
 
-        json_str = _extract_json_string(script_elements[0].text)
+        json_str = _extract_json_string(script)
         profile_data = loads(json_str)
 
         return profile_data
@@ -1,8 +1,9 @@
 import sys
 
+from collections.abc import Callable
+from dataclasses import dataclass, fields as dataclass_fields
 from datetime import datetime
-from jarowinkler import jarowinkler_similarity
-from lxml import html
+from functools import cache
 from lxml.html import HtmlElement
 from re import search, sub
 
@@ -10,13 +11,18 @@ from models.betfair import BSPMap
 from models.race import RaceInfo, RunnerInfo
 from utils.pedigree import Pedigree
 
+from utils.betfair_match import match_runners
 from utils.cleaning import clean_race, clean_string, strip_row
 from utils.date import convert_date
 from utils.going import get_surface
+from utils.horse_table import HorseTable
 from utils.lps import get_lps_scale
-from utils.lxml_funcs import find
+from utils.lxml_funcs import find, find_element
 from utils.network import NetworkClient
+from utils.page_slice import parse_race_page
+from utils.race_filter import RaceFilter
 from utils.region import get_region
+from utils.xpaths import PRIZE_MONEY, RACE_HEADER, RACE_INFO_ITEMS, RACE_INFO_VALUES
 
 
 regex_class = r'(\(|\s)(C|c)lass (\d|[A-Ha-h])(\)|\s)'
@@ -27,14 +33,23 @@ class VoidRaceError(Exception):
     pass
 
 
+class IncompleteRaceError(Exception):
+    pass
+
+
+class FilteredRaceError(Exception):
+    pass
+
+
 class Race:
     def __init__(
         self,
-        client: NetworkClient,
+        client: NetworkClient | None,
         url: str,
         document: HtmlElement,
         fields: list[str],
         bsp_map: BSPMap | None = None,
+        race_filter: RaceFilter | None = None,
     ):
         self.url: str = url
         self.doc: HtmlElement = document
@@ -43,13 +58,16 @@ class Race:
 
         url_split = self.url.split('/')
 
-        date_time_info = self.doc.find('.//main[@data-analytics-race-date-time]')
+        date_time_info = first(RACE_HEADER(self.doc))
 
         while date_time_info is None:
-            _, response = client.get(self.url)
-            doc = html.fromstring(response.content)
+            if client is None:
+                raise IncompleteRaceError(f'IncompleteRaceError: {self.url}')
+
+            _, response = client.get(self.url, use_cache=False)
+            doc = parse_race_page(response.content)
 
-            date_time_info = doc.find('.//main[@data-analytics-race-date-time]')
+            date_time_info = first(RACE_HEADER(doc))
             self.doc = doc
 
         self.race_info.course = date_time_info.attrib['data-analytics-coursename']
@@ -98,8 +116,36 @@ class Race:
         self.race_info.race_type = self.get_race_type()
         self.race_info.ran = self.get_num_runners()
 
-        pedigree_info = self.doc.xpath("//tr[@data-test-selector='block-pedigreeInfoFullResults']/td")
-        pedigree = Pedigree(pedigree_info)
+        # everything above comes from the header, so a race the request does not
+        # want is dropped before the runner table is read
+        position = find_element(self.doc, 'span', 'text-horsePosition')
+        if position is not None and (position.text or '').strip() == 'VOI':
+            raise VoidRaceError(f'VoidRaceError: {self.url}')
+
+        if race_filter is not None and not race_filter.matches(self.race_info):
+            raise FilteredRaceError(f'FilteredRaceError: {self.url}')
+
+        self.table: HorseTable = HorseTable(self.doc)
+
+        plan = extraction_plan(tuple(fields), bsp_map is not None)
+
+        for step in plan.steps:
+            step(self)
+
+        if bsp_map is not None:
+            self.join_betfair_data(bsp_map)
+
+        self.csv_data: list[str] = self.create_csv_data(fields)
+
+    def extract_positions(self) -> None:
+        self.runner_info.pos = self.get_positions()
+
+    def extract_numbers(self) -> None:
+        self.runner_info.num = self.get_numbers()
+        self.race_info.ran = self.race_info.ran if self.race_info.ran else str(len(self.runner_info.num))
+
+    def extract_pedigree(self) -> None:
+        pedigree = Pedigree(self.table.pedigrees)
 
         self.runner_info.sire_id = pedigree.id_sires
         self.runner_info.sire = pedigree.sires
@@ -107,43 +153,72 @@ class Race:
         self.runner_info.dam = pedigree.dams
         self.runner_info.damsire_id = pedigree.id_damsires
         self.runner_info.damsire = pedigree.damsires
-        self.runner_info.sex = self.get_sexs(pedigree.pedigrees)
+
+    def extract_sex(self) -> None:
+        self.runner_info.sex = self.get_sexs(self.table.pedigrees)
+
+    def extract_comments(self) -> None:
         self.runner_info.comment = self.get_comments()
-        self.runner_info.pos = self.get_positions()
+
+    def extract_prizes(self) -> None:
         self.runner_info.prize = self.get_prizemoney()
+
+    def extract_draws(self) -> None:
         self.runner_info.draw = self.get_draws()
+
+    def extract_distances(self) -> None:
         self.runner_info.ovr_btn, self.runner_info.btn = self.get_distance_btn()
+
+    def extract_prices(self) -> None:
         self.runner_info.sp = self.get_starting_prices()
-        self.runner_info.dec = self.get_decimal_odds()
-        self.runner_info.num = self.get_numbers()
 
-        self.race_info.ran = self.race_info.ran if self.race_info.ran else str(len(self.runner_info.num))
+    def extract_decimal_odds(self) -> None:
+        self.runner_info.dec = self.get_decimal_odds()
 
+    def extract_ages(self) -> None:
         self.runner_info.age = self.get_horse_ages()
+
+    def extract_horses(self) -> None:
         self.runner_info.horse = self.get_names_horse()
+
+    def extract_horse_ids(self) -> None:
         self.runner_info.horse_id = self.get_ids_horse()
+
+    def extract_jockeys(self) -> None:
         self.runner_info.jockey = self.get_names_jockey()
         self.runner_info.jockey_id = self.get_ids_jockey()
+
+    def extract_trainers(self) -> None:
         self.runner_info.trainer = self.get_names_trainer()
         self.runner_info.trainer_id = self.get_ids_trainer()
+
+    def extract_owners(self) -> None:
         self.runner_info.owner = self.get_names_owner()
         self.runner_info.owner_id = self.get_ids_owner()
+
+    def extract_headgear(self) -> None:
         self.runner_info.hg = self.get_headgear()
+
+    def extract_weights(self) -> None:
         self.runner_info.wgt, self.runner_info.lbs = self.get_weights()
-        self.runner_info.ofr = strip_row(self.doc.xpath('//td[@data-ending="OR"]/text()'))
-        self.runner_info.rpr = strip_row(self.doc.xpath('//td[@data-ending="RPR"]/text()'))
-        self.runner_info.ts = strip_row(self.doc.xpath('//td[@data-ending="TS"]/text()'))
-        self.runner_info.silk_url = self.doc.xpath('//img[@class="rp-horseTable__silk"]/@src')
+
+    def extract_ratings(self) -> None:
+        self.runner_info.ofr = strip_row(self.table.ofr)
+        self.runner_info.rpr = strip_row(self.table.rpr)
+        self.runner_info.ts = strip_row(self.table.ts)
+
+    def extract_silks(self) -> None:
+        self.runner_info.silk_url = self.table.silks
+
+    def extract_times(self) -> None:
         self.runner_info.time = self.get_finishing_times()
+
+    def extract_seconds(self) -> None:
         self.runner_info.secs = self.time_to_seconds(self.runner_info.time)
 
+    def extract_non_completions(self) -> None:
         self.clean_non_completions()
 
-        if bsp_map:
-            self.join_betfair_data(bsp_map)
-
-        self.csv_data: list[str] = self.create_csv_data(fields)
-
     def calculate_times(
         self, win_time: float, dist_btn: list[str], going: str, race_type: str
     ) -> list[str]:
@@ -163,28 +238,31 @@ class Race:
         return times
 
     def clean_non_completions(self):
+        # only the columns in the extraction plan have been filled
+        columns = [
+            values
+            for values in (
+                self.runner_info.time,
+                self.runner_info.secs,
+                self.runner_info.ovr_btn,
+                self.runner_info.btn,
+            )
+            if values
+        ]
+
         for i, pos in enumerate(self.runner_info.pos):
             if not pos.isnumeric() and pos != 'DSQ':
-                self.runner_info.time[i] = '-'
-                self.runner_info.secs[i] = '-'
-                self.runner_info.ovr_btn[i] = '-'
-                self.runner_info.btn[i] = '-'
+                for values in columns:
+                    values[i] = '-'
 
     def create_csv_data(self, fields: list[str]) -> list[str]:
-        field_mapping = {'type': 'race_type', 'class': 'race_class', 'or': 'ofr'}
-
-        race_values: list[str] = []
-        runner_values: list[list[str]] = []
+        plan = extraction_plan(tuple(fields), False)
 
-        for field in fields:
-            actual_field = field_mapping.get(field, field)
-
-            if hasattr(self.race_info, actual_field):
-                race_values.append(str(getattr(self.race_info, actual_field)))
-            elif hasattr(self.runner_info, actual_field):
-                runner_values.append([str(v) for v in getattr(self.runner_info, actual_field)])
+        race_prefix = ','.join(str(getattr(self.race_info, attr)) for attr in plan.race_columns)
+        runner_values = [
+            [str(v) for v in getattr(self.runner_info, attr)] for attr in plan.runner_columns
+        ]
 
-        race_prefix = ','.join(race_values)
         rows: list[str] = []
         for row in zip(*runner_values, strict=False):
             rows.append(race_prefix + ',' + ','.join(row) if race_prefix else ','.join(row))
@@ -194,8 +272,7 @@ class Race:
         def clean_comment(x: str):
             return x.strip().replace('  ', '').replace(',', ' -').replace('\n', ' ').replace('\r', '')
 
-        coms = self.doc.xpath("//tr[@class='rp-horseTable__commentRow ng-cloak']/td/text()")
-        return [clean_comment(com) for com in coms]
+        return [clean_comment(com) for com in self.table.comments]
 
     def get_decimal_odds(self):
         odds = [sub('(F|J|C)', '', sp) for sp in self.runner_info.sp]
@@ -205,7 +282,12 @@ class Race:
         btn: list[str] = []
         ovr_btn: list[str] = []
 
-        for element in self.doc.xpath("//span[@class='rp-horseTable__pos__length']"):
+        for element in self.table.lengths:
+            if element is None:
+                btn.append('')
+                ovr_btn.append('')
+                continue
+
             distances: list[HtmlElement] = element.findall('span')
 
             if len(distances) == 2:
@@ -241,9 +323,7 @@ class Race:
         return ovr_btn, btn
 
     def get_draws(self) -> list[str]:
-        draws = self.doc.xpath("//sup[@class='rp-horseTable__pos__draw']/text()")
-        return [draw.replace('\xa0', ' ').strip().strip('()') for draw in draws]
-        # return self.doc.xpath("//span[@class='rp-horseTable__pos__draw']/@data-order-draw")
+        return [draw.replace('\xa0', ' ').strip().strip('()') for draw in self.table.draws]
 
     def get_finishing_times(self):
         # adjust overall distance beaten when margins under a quarter length not accounted for
@@ -275,8 +355,7 @@ class Race:
 
     def get_headgear(self) -> list[str]:
         results: list[str] = []
-        for horse in self.doc.xpath("//td[contains(@class, 'rp-horseTable__wgt')]"):
-            hg = horse.find('.//span[@class="rp-horseTable__headGear"]')
+        for hg in self.table.headgear:
             if hg is None:
                 results.append('')
                 continue
@@ -288,58 +367,47 @@ class Race:
         return results
 
     def get_horse_ages(self) -> list[str]:
-        ages = self.doc.xpath("//td[@data-test-selector='horse-age']/text()")
-        return [age.strip() for age in ages]
+        return [age.strip() for age in self.table.ages]
 
     def get_ids_horse(self) -> list[str]:
-        horse_ids = self.doc.xpath("//a[@data-test-selector='link-horseName']/@href")
-        return [horse_id.split('/')[3] for horse_id in horse_ids]
+        return [link_id(link) for link in self.table.horse_links]
 
     def get_ids_jockey(self) -> list[str]:
-        jockey_ids = self.doc.xpath("//a[@data-test-selector='link-jockeyName']/@href")
-        return [jockey_id.split('/')[3] for jockey_id in jockey_ids[::2]]
+        return [link_id(link) for link in self.table.jockey_links]
 
     def get_ids_owner(self) -> list[str]:
-        owner_ids = self.doc.xpath("//a[@data-test-selector='link-silk']/@href")
-        return [owner_id.split('/')[3] for owner_id in owner_ids]
+        return [link_id(link) for link in self.table.owner_links]
 
     def get_ids_trainer(self) -> list[str]:
-        trainer_ids = self.doc.xpath("//a[@data-test-selector='link-trainerName']/@href")
-        return [trainer_id.split('/')[3] for trainer_id in trainer_ids[::2]]
+        return [link_id(link) for link in self.table.trainer_links]
 
     def get_names_horse(self) -> list[str]:
-        horses = self.doc.xpath("//a[@data-test-selector='link-horseName']/text()")
         nationalities = self.get_nationalities()
-        return [f'{clean_string(horse)} {nat}' for horse, nat in zip(horses, nationalities)]
+        return [
+            f'{clean_string(horse)} {nat}' for horse, nat in zip(self.table.horses, nationalities)
+        ]
 
     def get_names_jockey(self) -> list[str]:
-        jockeys = self.doc.xpath("//a[@data-test-selector='link-jockeyName']/text()")
-        return [clean_string(jock.strip()) for jock in jockeys[::3]]
+        return [clean_string(jock.strip()) for jock in self.table.jockeys]
 
     def get_names_owner(self) -> list[str]:
-        owners = self.doc.xpath("//a[@data-test-selector='link-silk']/@href")
-        return [owner.split('/')[4].replace('-', ' ').title() for owner in owners]
+        return [link_name(owner).replace('-', ' ').title() for owner in self.table.owner_links]
 
     def get_names_trainer(self) -> list[str]:
-        trainers = self.doc.xpath("//a[@data-test-selector='link-trainerName']/text()")
-        return [clean_string(trainer.strip()) for trainer in trainers[::2][::2]]
+        return [clean_string(trainer.strip()) for trainer in self.table.trainers]
 
     def get_nationalities(self) -> list[str]:
-        nats = self.doc.xpath("//span[@class='rp-horseTable__horse__country']/text()")
-        return [(nat.strip() or '(GB)') for nat in nats]
+        return [(nat.strip() or '(GB)') for nat in self.table.nationalities]
 
     def get_num_runners(self) -> str:
         ran = find(self.doc, 'span', 'rp-raceInfo__value rp-raceInfo__value_black')
         return ran.replace('ran', '').strip()
 
     def get_numbers(self) -> list[str]:
-        nums = self.doc.xpath("//span[@class='rp-horseTable__saddleClothNo']/text()")
-        return [num.strip('.') for num in nums]
+        return [num.strip('.') for num in self.table.numbers]
 
     def get_positions(self) -> list[str]:
-        positions = self.doc.xpath("//span[@data-test-selector='text-horsePosition']/text()")
-        del positions[1::2]
-        positions = [pos.strip() for pos in positions]
+        positions = [pos.strip() for pos in self.table.positions]
 
         if len(positions) > 0 and positions[0] == 'VOI':
             raise VoidRaceError(f'VoidRaceError: {self.url}')
@@ -347,7 +415,7 @@ class Race:
         return positions
 
     def get_prizemoney(self) -> list[str]:
-        prizes = self.doc.xpath("//div[@data-test-selector='text-prizeMoney']/text()")
+        prizes: list[str] = PRIZE_MONEY(self.doc)
         prizes = [p.strip().replace(',', '').replace('£', '') for p in prizes]
 
         if prizes:
@@ -483,10 +551,14 @@ class Race:
         # ---- 5. Default for >=12f with no obstacle signal ----
         return 'Flat'
 
-    def get_sexs(self, info: list[HtmlElement]) -> list[str]:
+    def get_sexs(self, info: list[HtmlElement | None]) -> list[str]:
         sexs: list[str] = []
 
         for element in info:
+            if element is None:
+                sexs.append('')
+                continue
+
             text_parts = (element.text or '').strip().split()
 
             if len(text_parts) == 1:
@@ -501,25 +573,29 @@ class Race:
         return sexs
 
     def get_starting_prices(self) -> list[str]:
-        sps = self.doc.xpath("//span[@class='rp-horseTable__horse__price']/text()")
-        return [sp.replace('No Odds', '').strip() for sp in sps]
+        return [sp.replace('No Odds', '').strip() for sp in self.table.prices]
 
     def get_weights(self) -> tuple[list[str], list[str]]:
-        stones = self.doc.xpath("//span[@data-ending='st']/text()")
-        pounds = self.doc.xpath("//span[@data-ending='lb']/text()")
+        wgt: list[str] = []
+        lbs: list[str] = []
 
-        weights = [f'{s}-{p}' for s, p in zip(stones, pounds)]
-        lbs = [str(int(s) * 14 + int(p)) for s, p in zip(stones, pounds)]
-        wgt = [w.strip() for w in weights]
+        for s, p in zip(self.table.stones, self.table.pounds):
+            if not s.strip() or not p.strip():
+                wgt.append('')
+                lbs.append('')
+                continue
+
+            wgt.append(f'{s}-{p}'.strip())
+            lbs.append(str(int(s) * 14 + int(p)))
 
         return wgt, lbs
 
     def get_winning_time(self) -> float | None:
-        items = self.doc.xpath('//div[@class="rp-raceInfo"]/ul/li')
+        items: list[HtmlElement] = RACE_INFO_ITEMS(self.doc)
         if not items:
             raise ValueError(f'No race info found: {self.url}')
 
-        spans = items[0].findall('.//span[@class="rp-raceInfo__value"]')
+        spans: list[HtmlElement] = RACE_INFO_VALUES(items[0])
         if len(spans) not in (2, 3):
             raise ValueError(f'Unexpected number of time spans in {self.url}')
 
@@ -557,18 +633,17 @@ class Race:
         if not bsp:
             return
 
-        for i, horse in enumerate(self.runner_info.horse):
-            name = horse.split('(')[0].strip().lower()
-            for row in bsp:
-                if jarowinkler_similarity(name, row.horse) >= 0.77:
-                    self.runner_info.bsp[i] = row.bsp or ''
-                    self.runner_info.pre_min[i] = row.pre_min or ''
-                    self.runner_info.pre_max[i] = row.pre_max or ''
-                    self.runner_info.ip_min[i] = row.ip_min or ''
-                    self.runner_info.ip_max[i] = row.ip_max or ''
-                    self.runner_info.pre_vol[i] = row.pre_vol or ''
-                    self.runner_info.ip_vol[i] = row.ip_vol or ''
-                    break
+        for i, j in enumerate(match_runners(self.runner_info.horse, bsp.horses, bsp.keys)):
+            if j is None:
+                continue
+
+            self.runner_info.bsp[i] = bsp.value(j, 'bsp')
+            self.runner_info.pre_min[i] = bsp.value(j, 'pre_min')
+            self.runner_info.pre_max[i] = bsp.value(j, 'pre_max')
+            self.runner_info.ip_min[i] = bsp.value(j, 'ip_min')
+            self.runner_info.ip_max[i] = bsp.value(j, 'ip_max')
+            self.runner_info.pre_vol[i] = bsp.value(j, 'pre_vol')
+            self.runner_info.ip_vol[i] = bsp.value(j, 'ip_vol')
 
     def parse_race_bands(self) -> tuple[str, str]:
         band = find(self.doc, 'span', 'rp-raceTimeCourseName_ratingBandAndAgesAllowed', property='class')
@@ -623,6 +698,110 @@ class Race:
         return [convert_time(t) for t in times]
 
 
+# extraction steps with the steps they read from, in the order they run
+STEPS: dict[str, tuple[str, ...]] = {
+    'positions': (),
+    'numbers': (),
+    'pedigree': (),
+    'sex': (),
+    'comments': (),
+    'prizes': ('positions',),
+    'draws': (),
+    'distances': ('positions',),
+    'prices': (),
+    'decimal_odds': ('prices',),
+    'ages': (),
+    'horses': (),
+    'horse_ids': (),
+    'jockeys': (),
+    'trainers': (),
+    'owners': (),
+    'headgear': (),
+    'weights': (),
+    'ratings': (),
+    'silks': (),
+    'times': ('distances', 'numbers'),
+    'seconds': ('times',),
+    'non_completions': ('positions',),
+}
+
+# runner columns and the step that fills them
+COLUMN_STEPS: dict[str, str] = {
+    'num': 'numbers',
+    'pos': 'positions',
+    'draw': 'draws',
+    'ovr_btn': 'distances',
+    'btn': 'distances',
+    'horse_id': 'horse_ids',
+    'horse': 'horses',
+    'age': 'ages',
+    'sex': 'sex',
+    'wgt': 'weights',
+    'lbs': 'weights',
+    'hg': 'headgear',
+    'time': 'times',
+    'secs': 'seconds',
+    'sp': 'prices',
+    'dec': 'decimal_odds',
+    'jockey_id': 'jockeys',
+    'jockey': 'jockeys',
+    'trainer_id': 'trainers',
+    'trainer': 'trainers',
+    'prize': 'prizes',
+    'ofr': 'ratings',
+    'rpr': 'ratings',
+    'ts': 'ratings',
+    'sire_id': 'pedigree',
+    'sire': 'pedigree',
+    'dam_id': 'pedigree',
+    'dam': 'pedigree',
+    'damsire_id': 'pedigree',
+    'damsire': 'pedigree',
+    'owner_id': 'owners',
+    'owner': 'owners',
+    'silk_url': 'silks',
+    'comment': 'comments',
+}
+
+FIELD_MAPPING = {'type': 'race_type', 'class': 'race_class', 'or': 'ofr'}
+
+RACE_COLUMNS = {f.name for f in dataclass_fields(RaceInfo)}
+RUNNER_COLUMNS = {f.name for f in dataclass_fields(RunnerInfo)}
+
+
+@dataclass(frozen=True)
+class ExtractionPlan:
+    steps: tuple[Callable[[Race], None], ...]
+    race_columns: tuple[str, ...]
+    runner_columns: tuple[str, ...]
+
+
+@cache
+def extraction_plan(fields: tuple[str, ...], betfair: bool) -> ExtractionPlan:
+    """The steps Race runs and the columns it writes for a set of output fields."""
+    columns = [FIELD_MAPPING.get(field, field) for field in fields]
+
+    race_columns = tuple(c for c in columns if c in RACE_COLUMNS)
+    runner_columns = tuple(c for c in columns if c not in RACE_COLUMNS and c in RUNNER_COLUMNS)
+
+    needed = {'positions', 'numbers', 'non_completions'}
+    needed.update(COLUMN_STEPS[c] for c in runner_columns if c in COLUMN_STEPS)
+
+    if betfair:
+        needed.add('horses')
+
+    pending = list(needed)
+    while pending:
+        for dependency in STEPS[pending.pop()]:
+            if dependency not in needed:
+                needed.add(dependency)
+                pending.append(dependency)
+
+    steps = tuple(getattr(Race, f'extract_{step}') for step in STEPS if step in needed)
+
+    return ExtractionPlan(steps, race_columns, runner_columns)
+
+
 def distance_to_decimal(dist: str):
     return (
         dist.strip()
@@ -691,6 +870,20 @@ def fraction_to_decimal(fractions: list[str]) -> list[str]:
     return decimal
 
 
+def first(elements: list[HtmlElement]) -> HtmlElement | None:
+    return elements[0] if elements else None
+
+
+def link_id(href: str) -> str:
+    parts = href.split('/')
+    return parts[3] if len(parts) > 3 else ''
+
+
+def link_name(href: str) -> str:
+    parts = href.split('/')
+    return parts[4] if len(parts) > 4 else ''
+
+
 def parse_time(date_time: str):
     time = datetime.fromisoformat(date_time).time()
     return f'{time.strftime("%H:%M")}'
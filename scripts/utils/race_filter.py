@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+from models.race import RaceInfo
+
+
+RACE_TYPES: dict[str, frozenset[str]] = {
+    'flat': frozenset({'Flat'}),
+    'jumps': frozenset({'Chase', 'Hurdle', 'NH Flat'}),
+}
+
+
+@dataclass(frozen=True)
+class RaceFilter:
+    """Request filters checked against the race header, empty fields match every race."""
+
+    race_type: str = 'all'
+    classes: frozenset[str] = frozenset()
+    min_dist: float = 0.0
+    going: tuple[str, ...] = ()
+    patterns: tuple[str, ...] = ()
+
+    def matches(self, info: RaceInfo) -> bool:
+        allowed = RACE_TYPES.get(self.race_type)
+        if allowed is not None and info.race_type not in allowed:
+            return False
+
+        if self.classes and info.race_class.removeprefix('Class ').strip() not in self.classes:
+            return False
+
+        if self.min_dist and furlongs(info.dist_f) < self.min_dist:
+            return False
+
+        if self.going and not any(term in info.going.lower() for term in self.going):
+            return False
+
+        if self.patterns and not any(term in info.pattern.lower() for term in self.patterns):
+            return False
+
+        return True
+
+    def suffix(self) -> str:
+        """Filename suffix for the filters beyond race type."""
+        parts: list[str] = []
+
+        if self.classes:
+            parts.append('class-' + '-'.join(sorted(self.classes)))
+        if self.min_dist:
+            parts.append(f'min-{self.min_dist:g}f')
+        if self.going:
+            parts.append('going-' + '-'.join(self.going))
+        if self.patterns:
+            parts.append('pattern-' + '-'.join(self.patterns))
+
+        return ''.join(f'_{part}' for part in parts).replace(' ', '-')
+
+
+def furlongs(dist_f: str) -> float:
+    try:
+        return float(dist_f.rstrip('f'))
+    except ValueError:
+        return 0.0
+
+
+def split_terms(value: str | None) -> tuple[str, ...]:
+    if not value:
+        return ()
+    return tuple(term.strip().lower() for term in value.split(',') if term.strip())
@@ -0,0 +1,189 @@
+import sqlite3
+
+from collections.abc import Iterable
+from datetime import date
+from pathlib import Path
+from time import time
+
+
+# incomplete slices (current season, recent dates) are refetched after this many seconds
+REFRESH_SECONDS = 6 * 60 * 60
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS races (
+    race_id TEXT PRIMARY KEY,
+    course_id TEXT NOT NULL,
+    race_date TEXT NOT NULL,
+    race_type TEXT,
+    season TEXT,
+    url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS races_course_season ON races (course_id, race_type, season);
+CREATE INDEX IF NOT EXISTS races_date ON races (race_date, course_id);
+
+CREATE TABLE IF NOT EXISTS slices (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    complete INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+
+class RaceIndex:
+    """Race urls shared by every request, and the slices they were discovered from."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+        _ = self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def has_slice(self, kind: str, key: str) -> bool:
+        row = self.db.execute(
+            'SELECT fetched_at, complete FROM slices WHERE kind = ? AND key = ?',
+            (kind, key),
+        ).fetchone()
+
+        if row is None:
+            return False
+
+        fetched_at, complete = row
+        return bool(complete) or time() - fetched_at < REFRESH_SECONDS
+
+    def has_course_year(self, course_id: str, year: str, race_type: str) -> bool:
+        return self.has_slice('course_year', f'{course_id}/{year}/{race_type}')
+
+    def has_date(self, race_date: date) -> bool:
+        return self.has_slice('date', race_date.isoformat())
+
+    def add_course_year(
+        self, course_id: str, year: str, race_type: str, urls: Iterable[str], complete: bool
+    ) -> None:
+        with self.db:
+            for url in urls:
+                race_id, race_course_id, race_date = split_url(url)
+                # the first url seen is kept, cached pages are keyed by it
+                _ = self.db.execute(
+                    """
+                    INSERT INTO races (race_id, course_id, race_date, race_type, season, url)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (race_id) DO UPDATE SET
+                        race_type = excluded.race_type,
+                        season = excluded.season
+                    """,
+                    (race_id, race_course_id, race_date, race_type, year, url),
+                )
+
+            self.mark('course_year', f'{course_id}/{year}/{race_type}', complete)
+
+    def add_date(self, race_date: date, urls: Iterable[str], complete: bool) -> None:
+        with self.db:
+            for url in urls:
+                race_id, course_id, day = split_url(url)
+                _ = self.db.execute(
+                    """
+                    INSERT INTO races (race_id, course_id, race_date, url)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (race_id) DO NOTHING
+                    """,
+                    (race_id, course_id, day, url),
+                )
+
+            self.mark('date', race_date.isoformat(), complete)
+
+    def mark(self, kind: str, key: str, complete: bool) -> None:
+        _ = self.db.execute(
+            """
+            INSERT INTO slices (kind, key, fetched_at, complete) VALUES (?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET
+                fetched_at = excluded.fetched_at,
+                complete = excluded.complete
+            """,
+            (kind, key, time(), int(complete)),
+        )
+
+    def course_year_urls(
+        self,
+        course_ids: Iterable[str],
+        years: Iterable[str],
+        race_type: str,
+        window: tuple[date, date] | None = None,
+    ) -> list[str]:
+        """Urls for the races in the given course seasons, within window if given."""
+        query = 'SELECT url FROM races WHERE course_id = ? AND race_type = ? AND season = ?'
+        bounds: tuple[str, ...] = ()
+
+        if window is not None:
+            query += ' AND race_date BETWEEN ? AND ?'
+            bounds = (window[0].isoformat(), window[1].isoformat())
+
+        urls: list[str] = []
+
+        for course_id in course_ids:
+            for year in years:
+                rows = self.db.execute(query, (course_id, race_type, year, *bounds))
+                urls.extend(url for (url,) in rows)
+
+        return urls
+
+    def course_year_dates(
+        self, course_ids: Iterable[str], years: Iterable[str], race_type: str
+    ) -> list[date]:
+        dates: set[str] = set()
+
+        for course_id in course_ids:
+            for year in years:
+                rows = self.db.execute(
+                    'SELECT DISTINCT race_date FROM races'
+                    ' WHERE course_id = ? AND race_type = ? AND season = ?',
+                    (course_id, race_type, year),
+                )
+                dates.update(race_date for (race_date,) in rows)
+
+        return [date.fromisoformat(race_date) for race_date in sorted(dates)]
+
+    def date_urls(
+        self, dates: Iterable[date], course_ids: set[str], race_type: str = 'all'
+    ) -> list[str]:
+        """Urls for races on the given dates, skipping races known to be another type."""
+        urls: list[str] = []
+
+        for race_date in dates:
+            rows = self.db.execute(
+                'SELECT course_id, url, race_type FROM races WHERE race_date = ?',
+                (race_date.isoformat(),),
+            )
+            urls.extend(
+                url
+                for course_id, url, known_type in rows
+                if course_id in course_ids
+                and (race_type == 'all' or known_type is None or known_type == race_type)
+            )
+
+        return urls
+
+    def recent_urls(self, limit: int) -> list[str]:
+        rows = self.db.execute(
+            'SELECT url FROM races ORDER BY race_date DESC LIMIT ?',
+            (limit,),
+        )
+        return [url for (url,) in rows]
+
+    def recent_dates(self, limit: int) -> list[str]:
+        rows = self.db.execute(
+            'SELECT DISTINCT race_date FROM races ORDER BY race_date DESC LIMIT ?',
+            (limit,),
+        )
+        return [race_date for (race_date,) in rows]
+
+
+def split_url(url: str) -> tuple[str, str, str]:
+    """Returns (race_id, course_id, date) for a results url."""
+    parts = url.split('/')
+    return parts[7], parts[4], parts[6]
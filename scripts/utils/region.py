@@ -1,18 +1,12 @@
 from orjson import loads
 
+from utils.course import course_region
+
 _regions = loads(open('../courses/_regions', 'r').read())
 
 
 def get_region(course_id: str) -> str:
-    courses = loads(open('../courses/_courses', 'r').read())
-    courses.pop('all')
-
-    for region, course in courses.items():
-        for _id in course.keys():
-            if _id == course_id:
-                return region.upper()
-
-    return ''
+    return course_region(course_id)
 
 
 def print_region(code: str, region: str):
@@ -0,0 +1,188 @@
+import sys
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from random import uniform
+from threading import Condition, Lock
+from time import monotonic
+from typing import Any
+
+
+RETRY_STATUSES = {406, 429, 500, 502, 503, 504, 520, 521, 522, 524}
+
+
+@dataclass(frozen=True)
+class RateLimits:
+    requests_per_second: float = 4.0
+    burst: int = 8
+    max_retries: int = 10
+    backoff_base: float = 1.0
+    backoff_max: float = 60.0
+    autotune: bool = True
+    sessions: int = 3
+    session_rejections: int = 3
+
+    @classmethod
+    def from_settings(cls, toml: Mapping[str, Any] | None) -> 'RateLimits':
+        network = (toml or {}).get('network', {})
+        defaults = cls()
+
+        # every request is sent at least once, exhausted() relies on a response
+        max_retries = int(network.get('max_retries', defaults.max_retries))
+        if max_retries < 1:
+            print(f'Invalid max_retries: {max_retries}, expected 1 or more.')
+            sys.exit(1)
+
+        return cls(
+            requests_per_second=float(
+                network.get('requests_per_second', defaults.requests_per_second)
+            ),
+            burst=int(network.get('burst', defaults.burst)),
+            max_retries=max_retries,
+            backoff_base=float(network.get('backoff_base', defaults.backoff_base)),
+            backoff_max=float(network.get('backoff_max', defaults.backoff_max)),
+            autotune=bool(network.get('autotune', defaults.autotune)),
+            sessions=int(network.get('sessions', defaults.sessions)),
+            session_rejections=int(
+                network.get('session_rejections', defaults.session_rejections)
+            ),
+        )
+
+
+class TokenBucket:
+    """Thread safe token bucket, reserve returns the seconds to sleep."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate: float = rate
+        self.burst: int = max(burst, 1)
+        self.tokens: float = float(self.burst)
+        self.updated: float = monotonic()
+        self.blocked_until: float = 0.0
+        self.lock: Lock = Lock()
+
+    def reserve(self) -> float:
+        with self.lock:
+            now = monotonic()
+
+            if self.rate > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.rate <= 0:
+                return max(0.0, self.blocked_until - now)
+
+            # tokens may go negative, later callers queue behind earlier reservations
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+            return max(wait, self.blocked_until - now)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+            self.tokens = min(self.tokens, 0.0)
+
+
+class ConcurrencyController:
+    """AIMD limit on requests in flight across the client."""
+
+    def __init__(self, adaptive: bool = True, cooldown: float = 2.0) -> None:
+        self.adaptive: bool = adaptive
+        self.cooldown: float = cooldown
+
+        self.ceiling: int = 1
+        self.limit: float = 1.0
+        self.highest: float = 1.0
+        self.backoffs: int = 0
+        self.last_decrease: float = 0.0
+        self.in_flight: int = 0
+        self.lock: Lock = Lock()
+        self.slots: Condition = Condition(self.lock)
+
+    @property
+    def window(self) -> int:
+        return max(1, int(self.limit))
+
+    def set_ceiling(self, ceiling: int) -> None:
+        with self.lock:
+            self.ceiling = max(ceiling, 1)
+
+            if self.adaptive:
+                self.limit = min(self.limit, self.ceiling)
+            else:
+                self.limit = float(self.ceiling)
+
+            self.highest = max(self.highest, self.limit)
+            self.slots.notify_all()
+
+    def acquire(self, timeout: float) -> bool:
+        with self.slots:
+            if not self.slots.wait_for(lambda: self.in_flight < self.window, timeout):
+                return False
+
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self.slots:
+            self.in_flight -= 1
+            self.slots.notify()
+
+    def success(self) -> None:
+        if not self.adaptive:
+            return
+
+        with self.lock:
+            self.limit = min(float(self.ceiling), self.limit + 1 / self.limit)
+            self.highest = max(self.highest, self.limit)
+            self.slots.notify()
+
+    def congestion(self) -> None:
+        with self.lock:
+            now = monotonic()
+
+            if now - self.last_decrease < self.cooldown:
+                return
+
+            self.last_decrease = now
+            self.backoffs += 1
+
+            if self.adaptive:
+                self.limit = max(1.0, self.limit / 2)
+
+    def summary(self) -> str:
+        if not self.adaptive:
+            return f'{self.window} requests in flight, {self.backoffs} backoffs'
+
+        return (
+            f'{self.window} requests in flight '
+            f'(peak {int(self.highest)}, {self.backoffs} backoffs)'
+        )
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    delay = min(cap, base * (2**attempt))
+    return delay / 2 + uniform(0, delay / 2)
+
+
+def retry_after(headers: Mapping[str, str]) -> float | None:
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if not value:
+        return None
+
+    value = value.strip()
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
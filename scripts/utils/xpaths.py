@@ -0,0 +1,29 @@
+from lxml import etree
+from threading import local
+from typing import Any
+
+
+class Selector:
+    """XPath compiled per thread, lxml locks calls to a shared XPath object."""
+
+    def __init__(self, expression: str) -> None:
+        self.expression: str = expression
+        self.local: local = local()
+
+    def __call__(self, element: etree._Element) -> list[Any]:
+        try:
+            compiled: etree.XPath = self.local.compiled
+        except AttributeError:
+            compiled = self.local.compiled = etree.XPath(self.expression)
+
+        return compiled(element)
+
+
+# race
+RACE_HEADER = Selector('descendant::main[@data-analytics-race-date-time][1]')
+RACE_INFO_ITEMS = Selector('//div[@class="rp-raceInfo"]/ul/li')
+RACE_INFO_VALUES = Selector('.//span[@class="rp-raceInfo__value"]')
+PRIZE_MONEY = Selector('//div[@data-test-selector="text-prizeMoney"]/text()')
+
+# horse table
+HORSE_LINKS = Selector('//a[@data-test-selector="link-horseName"]')